@@ -7,9 +7,33 @@ from django.core.urlresolvers import reverse
 from pybb.models import Category, Forum, Topic, Post, Profile, Attachment, PollAnswer
 
 from pybb import compat, util
+from pybb.signals import topic_moderated, post_moderated
 username_field = compat.get_username_field()
 
 
+def moderation_action(name, description, **changes):
+    """
+    Admin action which applies `changes` to selected topics or posts with single UPDATE query
+    and sends `topic_moderated` / `post_moderated` signal for each of them
+    """
+    def action(modeladmin, request, queryset):
+        objects = list(queryset)
+        queryset.model.objects.filter(pk__in=[obj.pk for obj in objects]).update(**changes)
+        for obj in objects:
+            for field_name, value in changes.items():
+                setattr(obj, field_name, value)
+            if queryset.model is Topic:
+                topic_moderated.send(sender=Topic, topic=obj, user=request.user, changes=changes)
+            else:
+                post_moderated.send(sender=Post, post=obj, user=request.user, changes=changes)
+        if queryset.model is Post and changes.get('on_moderation') is False:
+            # topics are moderated with their head posts
+            Topic.objects.filter(first_post__in=objects, on_moderation=True).update(on_moderation=False)
+    action.__name__ = str(name)
+    action.short_description = description
+    return action
+
+
 class ForumInlineAdmin(admin.TabularInline):
     model = Forum
     fields = ['name', 'hidden', 'position']
@@ -74,6 +98,12 @@ class TopicAdmin(admin.ModelAdmin):
          ),
         )
     inlines = [PollAnswerAdmin, ]
+    actions = [
+        moderation_action('stick_topics', _('Stick selected topics'), sticky=True),
+        moderation_action('unstick_topics', _('Unstick selected topics'), sticky=False),
+        moderation_action('close_topics', _('Close selected topics'), closed=True),
+        moderation_action('open_topics', _('Open selected topics'), closed=False),
+    ]
 
 class TopicReadTrackerAdmin(admin.ModelAdmin):
     list_display = ['topic', 'user', 'time_stamp']
@@ -90,6 +120,7 @@ class PostAdmin(admin.ModelAdmin):
     ordering = ['-created']
     date_hierarchy = 'created'
     search_fields = ['body']
+    actions = [moderation_action('approve_posts', _('Approve selected posts'), on_moderation=False)]
     fieldsets = (
         (None, {
                 'fields': ('topic', 'user')
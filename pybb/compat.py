@@ -92,6 +92,17 @@ def get_paginator_class():
     return Paginator, pure_pagination
 
 
+def set_paginator_count(paginator, count):
+    """
+    Provide objects count to paginator, so it doesn't run COUNT query
+    """
+    if isinstance(getattr(type(paginator), 'count', None), property):
+        # Django < 1.8 and pure_pagination paginators cache count in `_count`
+        paginator._count = count
+    else:
+        paginator.count = count
+
+
 def is_installed(app_name):
     if django.VERSION[:2] < (1, 7):
         from django.db.models import get_apps
@@ -120,3 +131,84 @@ def slugify(text):
         from django.utils.text import slugify as django_slugify
 
     return django_slugify(force_text(unidecode(text)))
+
+
+def bulk_update(model, rows, fields):
+    """
+    Update `fields` of many `model` rows with a single UPDATE statement where possible.
+    `rows` is a mapping of primary key to dict of field values.
+    Django < 1.8 has no conditional expressions, so rows are updated one by one there.
+    """
+    if not rows:
+        return
+    if django.VERSION[:2] < (1, 8):
+        for pk, values in rows.items():
+            model.objects.filter(pk=pk).update(**dict((f, values[f]) for f in fields))
+        return
+
+    from django.db.models import Case, F, Value, When
+    changes = {}
+    for field in fields:
+        changes[field] = Case(
+            default=F(field),
+            output_field=model._meta.get_field(field),
+            *[When(pk=pk, then=Value(values[field])) for pk, values in rows.items()]
+        )
+    model.objects.filter(pk__in=list(rows.keys())).update(**changes)
+
+
+def bulk_upsert(model, rows, unique_fields, update_fields, chunk_size=250):
+    """
+    Insert `rows` (list of dicts with the same fields) into `model` table, updating `update_fields` of rows
+    which already exist with the same `unique_fields`. Uses single INSERT ... ON CONFLICT (PostgreSQL 9.5+,
+    SQLite 3.24+) or INSERT ... ON DUPLICATE KEY UPDATE (MySQL) statement per chunk of rows.
+    Other databases fall back to UPDATE and INSERT for every row.
+    """
+    from django.db import connections, router, transaction, DatabaseError, models
+
+    if not rows:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    if connection.vendor == 'postgresql' and connection.pg_version >= 90500 or \
+            connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 24, 0):
+        conflict = 'ON CONFLICT (%s) DO UPDATE SET %s' % (
+            ', '.join(qn(model._meta.get_field(f).column) for f in unique_fields),
+            ', '.join('%s = EXCLUDED.%s' % ((qn(model._meta.get_field(f).column),) * 2) for f in update_fields))
+    elif connection.vendor == 'mysql':
+        conflict = 'ON DUPLICATE KEY UPDATE %s' % (
+            ', '.join('%s = VALUES(%s)' % ((qn(model._meta.get_field(f).column),) * 2) for f in update_fields))
+    else:
+        for row in rows:
+            lookup = dict((f, row[f]) for f in unique_fields)
+            changes = dict((f, row[f]) for f in update_fields)
+            if model._default_manager.using(using).filter(**lookup).update(**changes):
+                continue
+            sid = transaction.savepoint(using=using)
+            try:
+                with get_atomic_func()():
+                    model._default_manager.using(using).create(**row)
+                transaction.savepoint_commit(sid)
+            except DatabaseError:
+                transaction.savepoint_rollback(sid)
+            # created row could get values of `auto_now` fields instead of given ones
+            model._default_manager.using(using).filter(**lookup).update(**changes)
+        return
+
+    names = list(unique_fields) + [f for f in sorted(rows[0]) if f not in unique_fields]
+    fields = [model._meta.get_field(name) for name in names]
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+    cursor = connection.cursor()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        params = []
+        for row in chunk:
+            for name, field in zip(names, fields):
+                value = row[name]
+                if isinstance(value, models.Model):
+                    value = value.pk
+                params.append(field.get_db_prep_save(value, connection))
+        cursor.execute('INSERT INTO %s (%s) VALUES %s %s' % (
+            qn(model._meta.db_table), ', '.join(qn(field.column) for field in fields),
+            ', '.join([placeholders] * len(chunk)), conflict), params)
@@ -8,6 +8,8 @@ from django.utils.six import string_types
 
 PYBB_TOPIC_PAGE_SIZE = getattr(settings, 'PYBB_TOPIC_PAGE_SIZE', 10)
 PYBB_FORUM_PAGE_SIZE = getattr(settings, 'PYBB_FORUM_PAGE_SIZE', 20)
+PYBB_KEYSET_PAGINATION = getattr(settings, 'PYBB_KEYSET_PAGINATION', False)
+PYBB_PAGE_ANCHORS_CACHE_TIMEOUT = getattr(settings, 'PYBB_PAGE_ANCHORS_CACHE_TIMEOUT', 300)
 PYBB_AVATAR_WIDTH = getattr(settings, 'PYBB_AVATAR_WIDTH', 80)
 PYBB_AVATAR_HEIGHT = getattr(settings, 'PYBB_AVATAR_HEIGHT', 80)
 PYBB_MAX_AVATAR_SIZE = getattr(settings, 'PYBB_MAX_AVATAR_SIZE', 1024 * 50)
@@ -106,14 +108,18 @@ if not PYBB_MARKUP or PYBB_MARKUP not in PYBB_MARKUP_ENGINES:
                                    'PYBB_MARKUP_ENGINES_PATHS')
 
 PYBB_TEMPLATE = getattr(settings, 'PYBB_TEMPLATE', "base.html")
+PYBB_POST_CACHE_TIMEOUT = getattr(settings, 'PYBB_POST_CACHE_TIMEOUT', 0)
+PYBB_FEED_CACHE_TIMEOUT = getattr(settings, 'PYBB_FEED_CACHE_TIMEOUT', 0)
 PYBB_DEFAULT_AUTOSUBSCRIBE = getattr(settings, 'PYBB_DEFAULT_AUTOSUBSCRIBE', True)
 PYBB_ENABLE_ANONYMOUS_POST = getattr(settings, 'PYBB_ENABLE_ANONYMOUS_POST', False)
 PYBB_ANONYMOUS_USERNAME = getattr(settings, 'PYBB_ANONYMOUS_USERNAME', 'Anonymous')
 PYBB_ANONYMOUS_VIEWS_CACHE_BUFFER = getattr(settings, 'PYBB_ANONYMOUS_VIEWS_CACHE_BUFFER', 100)
+PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT = getattr(settings, 'PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT', 0)
 
 PYBB_DISABLE_SUBSCRIPTIONS = getattr(settings, 'PYBB_DISABLE_SUBSCRIPTIONS', False)
 PYBB_DISABLE_NOTIFICATIONS = getattr(settings, 'PYBB_DISABLE_NOTIFICATIONS', False)
 PYBB_PREMODERATION = getattr(settings, 'PYBB_PREMODERATION', False)
+PYBB_FORUM_COUNTER_SHARDS = getattr(settings, 'PYBB_FORUM_COUNTER_SHARDS', 0)
 
 if not hasattr(settings, 'PYBB_BODY_CLEANERS'):
     PYBB_BODY_CLEANERS = ['pybb.markup.base.rstrip_str', 'pybb.markup.base.filter_blanks']
@@ -130,6 +136,10 @@ PYBB_USE_DJANGO_MAILER = getattr(settings, 'PYBB_USE_DJANGO_MAILER', False)
 
 PYBB_PERMISSION_HANDLER = getattr(settings, 'PYBB_PERMISSION_HANDLER', 'pybb.permissions.DefaultPermissionHandler')
 
+PYBB_READ_TRACKING_BACKEND = getattr(settings, 'PYBB_READ_TRACKING_BACKEND', 'pybb.read_tracking.RowReadTracking')
+PYBB_READ_MARKS_BUFFER_SIZE = getattr(settings, 'PYBB_READ_MARKS_BUFFER_SIZE', 0)
+PYBB_READ_MARKS_FLUSH_INTERVAL = getattr(settings, 'PYBB_READ_MARKS_FLUSH_INTERVAL', 60)
+
 PYBB_PROFILE_RELATED_NAME = getattr(settings, 'PYBB_PROFILE_RELATED_NAME', 'pybb_profile')
 
 PYBB_INITIAL_CUSTOM_USER_MIGRATION = getattr(settings, 'PYBB_INITIAL_CUSTOM_USER_MIGRATION', None)
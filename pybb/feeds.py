@@ -2,16 +2,58 @@
 
 from __future__ import unicode_literals
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.http import HttpResponse
 from django.utils.feedgenerator import Atom1Feed
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import ugettext_lazy as _, get_language
 
-from pybb.models import Post, Topic
+from pybb import defaults, invalidation, util
+from pybb.models import Category, Forum, Post, Topic
 
 from pybb.permissions import perms
+from pybb.views import conditional_get
 
 class PybbFeed(Feed):
     feed_type = Atom1Feed
+    items_count = 15
+
+    def __call__(self, request, *args, **kwargs):
+        return conditional_get(request, self.get_cached_response, list(Category.objects.all()),
+                               invalidation.get_last_update(Forum.objects.all()), *args, **kwargs)
+
+    def get_cached_response(self, request, *args, **kwargs):
+        """
+        Feed is rendered once for each group of users with the same permissions and cached until
+        the next change on forum, see PYBB_FEED_CACHE_TIMEOUT setting
+        """
+        group = perms.get_cache_group(request.user)
+        if not defaults.PYBB_FEED_CACHE_TIMEOUT or group is None:
+            return super(PybbFeed, self).__call__(request, *args, **kwargs)
+        cache_key = util.build_cache_key('feed', name=type(self).__name__.lower(), group=group,
+                                         language=get_language(),
+                                         version=invalidation.get_version(*Category.objects.all()))
+        cached = cache.get(cache_key)
+        if cached is None:
+            response = super(PybbFeed, self).__call__(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cached = {'content': response.content, 'content_type': response['Content-Type']}
+            cache.set(cache_key, cached, defaults.PYBB_FEED_CACHE_TIMEOUT)
+        return HttpResponse(cached['content'], content_type=cached['content_type'])
+
+    def get_latest_ids(self, user, model, filter_func):
+        """
+        Ids of latest `model` objects visible to `user`. Candidates are taken from the list of latest ids
+        kept in cache, whole table is ordered only if too many of them are hidden from the user.
+        """
+        qs = model.objects.only('id').order_by('-created', '-id')
+        if defaults.PYBB_FEED_CACHE_TIMEOUT:
+            candidates = invalidation.get_latest_ids(model)
+            ids = [obj.id for obj in filter_func(user, qs.filter(id__in=candidates))[:self.items_count]]
+            if len(ids) == self.items_count or len(candidates) < invalidation.LATEST_IDS_LIMIT:
+                return ids
+        return [obj.id for obj in filter_func(user, qs)[:self.items_count]]
 
     def link(self):
         return reverse('pybb:index')
@@ -33,7 +75,7 @@ class LastPosts(PybbFeed):
         return request.user
 
     def items(self, user):
-        ids = [p.id for p in perms.filter_posts(user, Post.objects.only('id')).order_by('-created', '-id')[:15]]
+        ids = self.get_latest_ids(user, Post, perms.filter_posts)
         return Post.objects.filter(id__in=ids).select_related('topic', 'topic__forum', 'user')
 
 
@@ -47,4 +89,6 @@ class LastTopics(PybbFeed):
         return request.user
 
     def items(self, user):
-        return perms.filter_topics(user, Topic.objects.all()).select_related('forum').order_by('-created', '-id')[:15]
+        ids = self.get_latest_ids(user, Topic, perms.filter_topics)
+        return Topic.objects.filter(id__in=ids).select_related('forum', 'first_post', 'first_post__user')\
+            .order_by('-created', '-id')
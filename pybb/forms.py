@@ -160,7 +160,9 @@ class PostForm(forms.ModelForm):
         if not allow_post:
             post.on_moderation = True
         if commit:
-            topic.save()
+            if topic.pk is None:
+                # counters of existing topic are updated by post save
+                topic.save()
             post.topic = topic
             post.save()
         return post, topic
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Generations of cached objects. Each object has a generation value kept in cache, which is changed
+when the object or any object below it is saved or deleted (post -> topic -> forum -> parent forums
+-> category). Cache keys built with generations of objects become stale by themselves, so cached
+data never has to be found and deleted. Generations are changed from signal handlers set up in
+`pybb.signals`.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.translation import get_language
+
+from pybb import defaults, util
+from pybb.models import Forum, Topic, Post, ForumCounterShard
+from pybb.read_tracking import get_marks_version
+
+
+# number of latest post and topic ids kept in cache for feeds
+LATEST_IDS_LIMIT = 100
+
+
+def is_enabled():
+    """
+    True if any cache which relies on generations is enabled by settings. Generations are
+    maintained (and ETags are sent) only in this case.
+    """
+    return bool(defaults.PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT or defaults.PYBB_FEED_CACHE_TIMEOUT or
+                defaults.PYBB_POST_CACHE_TIMEOUT)
+
+
+def _generation_key(obj):
+    return util.build_cache_key('generation', model=obj._meta.object_name.lower(), pk=obj.pk)
+
+
+def get_ancestors(obj):
+    """
+    Objects which content depends on `obj`: topic, forums and category of the post and so on.
+    Ancestors which were already deleted are skipped.
+    """
+    try:
+        if isinstance(obj, Post):
+            return list(obj.topic.get_parents()) + [obj.topic]
+        elif isinstance(obj, (Topic, Forum)):
+            return list(obj.get_parents())
+    except ObjectDoesNotExist:
+        pass
+    return []
+
+
+def get_generations(*objects):
+    """
+    Current generations of `objects`. New generation is set if it wasn't set yet or was evicted
+    from cache, so any value read before can't be returned again.
+    """
+    keys = [_generation_key(obj) for obj in objects]
+    generations = cache.get_many(keys)
+    missing = dict((key, uuid.uuid4().hex) for key in keys if key not in generations)
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def get_version(*objects):
+    """
+    Single value to use in cache key which changes with generation of any of `objects`.
+    """
+    return '_'.join(get_generations(*objects))
+
+
+def attach_post_versions(posts):
+    """
+    Set versions used by `pybb_post_cache` tag to `posts` with single cache request
+    instead of a request per post.
+    """
+    posts = [post for post in posts if post is not None]
+    generations = get_generations(*[obj for post in posts for obj in (post, post.user)])
+    for i, post in enumerate(posts):
+        post._pybb_cache_version = '_'.join(generations[i * 2:i * 2 + 2])
+    return posts
+
+
+def get_etag(user, objects, *extra):
+    """
+    ETag of page with `objects` shown to `user`. Changes with generations of `objects`, `extra` values
+    and, for authenticated user, with user's own generation and read marks.
+    """
+    if user.is_authenticated():
+        viewer = '%s:%s' % (user.pk, get_marks_version(user.pk))
+        objects = list(objects) + [user]
+    else:
+        viewer = 'anonymous'
+    key = '%s:%s:%s:%s' % (viewer, get_language(), get_version(*objects), ':'.join('%s' % value for value in extra))
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def get_last_update(forums):
+    """
+    Time of the latest post in `forums`, not folded counter shards included
+    """
+    updated = [forum.updated for forum in ForumCounterShard.objects.apply(list(forums)) if forum.updated]
+    return max(updated) if updated else None
+
+
+def touch(*objects):
+    """
+    Change generations of `objects` and all their ancestors.
+    """
+    keys = set()
+    for obj in objects:
+        keys.add(_generation_key(obj))
+        keys.update(_generation_key(ancestor) for ancestor in get_ancestors(obj))
+    cache.delete_many(list(keys))
+
+
+def touch_forum(forum_id):
+    try:
+        touch(Forum.objects.select_related('category').get(pk=forum_id))
+    except Forum.DoesNotExist:
+        pass
+
+
+def touch_topic(topic_id):
+    try:
+        touch(Topic.objects.select_related('forum').get(pk=topic_id))
+    except Topic.DoesNotExist:
+        pass
+
+
+def get_latest_ids(model):
+    """
+    Ids of latest created `model` objects (posts or topics), latest first. The list is kept in cache
+    and updated when objects are created, so objects table isn't ordered on each call.
+    If list is shorter than `LATEST_IDS_LIMIT`, there are no other objects.
+    """
+    cache_key = util.build_cache_key('latest_ids', model=model._meta.object_name.lower())
+    ids = cache.get(cache_key)
+    if ids is None:
+        ids = list(model.objects.order_by('-created', '-id').values_list('id', flat=True)[:LATEST_IDS_LIMIT])
+        cache.add(cache_key, ids, defaults.PYBB_FEED_CACHE_TIMEOUT)
+    return ids
+
+
+def add_latest_id(obj):
+    cache_key = util.build_cache_key('latest_ids', model=obj._meta.object_name.lower())
+    lock_key = '%s_lock' % cache_key
+    if not cache.add(lock_key, True, 10):
+        # list is being changed concurrently, it will be read again from database
+        cache.delete(cache_key)
+        return
+    try:
+        ids = cache.get(cache_key)
+        if ids is not None and obj.pk not in ids:
+            cache.set(cache_key, ([obj.pk] + ids)[:LATEST_IDS_LIMIT], defaults.PYBB_FEED_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def reset_latest_ids(model):
+    cache.delete(util.build_cache_key('latest_ids', model=model._meta.object_name.lower()))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+
+from __future__ import unicode_literals
+
+import datetime
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pybb.compat import get_atomic_func
+from pybb.read_tracking import BufferedReadTracking, get_read_tracking, touch_marks_version
+
+
+class Command(BaseCommand):
+    help = 'Fold topic read marks into forum read marks and expire old topic read marks'
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', dest='days', default=None,
+                    help='Treat topics not updated for given number of days as read and drop older topic marks'),
+        make_option('--chunk-size', type='int', dest='chunk_size', default=500,
+                    help='Number of (user, forum) pairs processed in one transaction'),
+    )
+
+    def handle(self, *args, **options):
+        backend = get_read_tracking()
+        horizon = None
+        if options.get('days'):
+            horizon = timezone.now() - datetime.timedelta(days=options['days'])
+        chunk_size = options.get('chunk_size') or 500
+        if isinstance(backend, BufferedReadTracking):
+            # buffered marks are compacted too
+            flushed = backend.flush_all()
+            self.stdout.write('Flushed buffered read marks of %d users\n' % flushed)
+
+        pairs = list(backend.get_marked_forums())
+        started = time.time()
+        dropped = 0
+        for start in range(0, len(pairs), chunk_size):
+            chunk = pairs[start:start + chunk_size]
+            with get_atomic_func()():
+                chunk_dropped = sum(backend.compact_forum_marks(user_id, forum_id, horizon)
+                                    for user_id, forum_id in chunk)
+            for user_id in set(user_id for user_id, forum_id in chunk):
+                touch_marks_version(user_id)
+            dropped += chunk_dropped
+            self.stdout.write('[%d/%d] %d topic marks dropped\n' % (start + len(chunk), len(pairs), chunk_dropped))
+
+        elapsed = max(time.time() - started, 0.001)
+        self.stdout.write('Successfully compacted %d user forums, %d topic marks dropped in %.1fs (%.0f forums/s)\n' %
+                          (len(pairs), dropped, elapsed, len(pairs) / elapsed))
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from pybb.read_tracking import BufferedReadTracking, get_read_tracking
+
+
+class Command(BaseCommand):
+    help = 'Write topic read marks buffered in cache (see PYBB_READ_MARKS_BUFFER_SIZE setting)'
+
+    def handle(self, *args, **options):
+        backend = get_read_tracking()
+        flushed = backend.flush_all() if isinstance(backend, BufferedReadTracking) else 0
+        self.stdout.write('Successfully flushed read marks of %d users\n' % flushed)
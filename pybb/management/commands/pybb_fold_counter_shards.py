@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# vim:fileencoding=utf-8
+
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from pybb.models import ForumCounterShard
+
+
+class Command(BaseCommand):
+    help = 'Fold forum counter shards into forum counters (see PYBB_FORUM_COUNTER_SHARDS setting)'
+    option_list = BaseCommand.option_list + (
+        make_option('--forum', type='int', dest='forum', default=None,
+                    help='Fold counter shards only for the forum with given id'),
+    )
+
+    def handle(self, *args, **options):
+        forum_ids = [options['forum']] if options.get('forum') else None
+        folded = ForumCounterShard.objects.fold(forum_ids)
+        self.stdout.write('Successfully folded %d counter shards\n' % folded)
@@ -4,18 +4,146 @@
 from __future__ import unicode_literals
 __author__ = 'zeus'
 
+import time
+from multiprocessing import Pool
+from optparse import make_option
+
 from django.core.management.base import BaseCommand, CommandError
-from pybb.models import Topic, Forum
+from django.db import connections
+from django.db.models import Count, Max, Min
+
+from pybb.compat import bulk_update, get_atomic_func
+from pybb.models import Topic, Forum, ForumCounterShard, Post, renumber_posts
+
+
+def recount_forum(forum_id, chunk_size):
+    """
+    Recount counters and first/last post references of all topics of the forum
+    and of the forum itself with GROUP BY queries over posts. Topics are processed
+    in chunks, each chunk is updated in its own transaction and only changed rows
+    are written. Post positions are renumbered for topics where first or last post
+    position doesn't match. Returns (forum_id, topics processed, posts counted, topics changed).
+    """
+    topic_ids = list(Topic.objects.filter(forum_id=forum_id).order_by('id').values_list('id', flat=True))
+    post_count, topic_count, changed = 0, 0, 0
+    # (created, id, updated or created) of the latest forum post
+    forum_last = None
+
+    for start in range(0, len(topic_ids), chunk_size):
+        chunk = topic_ids[start:start + chunk_size]
+        stats = dict((row['topic_id'], row) for row in Post.objects.filter(topic_id__in=chunk).order_by()
+                     .values('topic_id').annotate(post_count=Count('id'), first_created=Min('created'),
+                                                  last_created=Max('created')))
+
+        first_posts, last_posts, positioned = {}, {}, set()
+        if stats:
+            dates = set(row['first_created'] for row in stats.values()) | \
+                set(row['last_created'] for row in stats.values())
+            candidates = Post.objects.filter(topic_id__in=list(stats.keys()), created__in=dates)
+            positions = {}
+            for topic_id, post_id, created, updated, position in \
+                    candidates.values_list('topic_id', 'id', 'created', 'updated', 'position'):
+                positions[post_id] = position
+                if created == stats[topic_id]['first_created']:
+                    if topic_id not in first_posts or first_posts[topic_id] > post_id:
+                        first_posts[topic_id] = post_id
+                if created == stats[topic_id]['last_created']:
+                    if topic_id not in last_posts or last_posts[topic_id][1] < post_id:
+                        last_posts[topic_id] = (created, post_id, updated or created)
+            positioned = set(topic_id for topic_id in stats
+                             if positions[first_posts[topic_id]] == 1 and
+                             positions[last_posts[topic_id][1]] == stats[topic_id]['post_count'])
+
+        rows = {}
+        for topic_id, old_post_count, old_updated, old_first_post, old_last_post in \
+                Topic.objects.filter(id__in=chunk).values_list('id', 'post_count', 'updated',
+                                                               'first_post', 'last_post'):
+            new_post_count = stats[topic_id]['post_count'] if topic_id in stats else 0
+            new_updated = last_posts[topic_id][2] if topic_id in last_posts else old_updated
+            new_first_post = first_posts.get(topic_id)
+            new_last_post = last_posts[topic_id][1] if topic_id in last_posts else None
+            if (new_post_count, new_updated, new_first_post, new_last_post) != \
+                    (old_post_count, old_updated, old_first_post, old_last_post):
+                rows[topic_id] = {'post_count': new_post_count, 'updated': new_updated,
+                                  'first_post': new_first_post, 'last_post': new_last_post}
+            post_count += new_post_count
+            topic_count += int(new_post_count > 0)
+            if topic_id in last_posts and (forum_last is None or forum_last < last_posts[topic_id]):
+                forum_last = last_posts[topic_id]
+
+        with get_atomic_func()():
+            bulk_update(Topic, rows, ['post_count', 'updated', 'first_post', 'last_post'])
+        changed += len(rows)
+        renumber_posts([topic_id for topic_id in stats if topic_id not in positioned], chunk_size)
+
+    forum_changes = {'post_count': post_count, 'topic_count': topic_count, 'last_post': None}
+    if forum_last is not None:
+        forum_changes['updated'] = forum_last[2]
+        forum_changes['last_post'] = forum_last[1]
+    with get_atomic_func()():
+        Forum.objects.filter(id=forum_id).update(**forum_changes)
+        ForumCounterShard.objects.filter(forum_id=forum_id).delete()
+    return forum_id, len(topic_ids), post_count, changed
+
+
+def _recount_forum_worker(args):
+    return recount_forum(*args)
+
+
+def _close_connections():
+    # Connections can't be shared with forked worker processes
+    for connection in connections.all():
+        connection.close()
+
 
 class Command(BaseCommand):
     help = 'Recalc post counters for forums and topics'
+    option_list = BaseCommand.option_list + (
+        make_option('--forum', type='int', dest='forum', default=None,
+                    help='Recalc counters only for the forum with given id'),
+        make_option('--category', type='int', dest='category', default=None,
+                    help='Recalc counters only for forums of the category with given id'),
+        make_option('--parallel', type='int', dest='parallel', default=1,
+                    help='Number of worker processes, work is splitted by forum'),
+        make_option('--chunk-size', type='int', dest='chunk_size', default=500,
+                    help='Number of topics updated in one transaction'),
+    )
 
     def handle(self, *args, **options):
+        forums = Forum.objects.all()
+        if options.get('forum'):
+            forums = forums.filter(id=options['forum'])
+        if options.get('category'):
+            forums = forums.filter(category_id=options['category'])
+        forum_ids = list(forums.order_by('id').values_list('id', flat=True))
+        if not forum_ids:
+            raise CommandError('No forums found')
+
+        chunk_size = options.get('chunk_size') or 500
+        parallel = options.get('parallel') or 1
+        tasks = [(forum_id, chunk_size) for forum_id in forum_ids]
+
+        started = time.time()
+        if parallel > 1:
+            _close_connections()
+            pool = Pool(parallel)
+            results = pool.imap_unordered(_recount_forum_worker, tasks)
+        else:
+            pool = None
+            results = (recount_forum(*task) for task in tasks)
 
-        for topic in Topic.objects.all():
-            topic.update_counters()
-            self.stdout.write('Successfully updated topic "%s"\n' % topic)
+        total_topics, total_posts = 0, 0
+        try:
+            for done, (forum_id, topics, posts, changed) in enumerate(results, 1):
+                total_topics += topics
+                total_posts += posts
+                self.stdout.write('[%d/%d] Forum %d: %d topics, %d posts, %d topics updated\n' %
+                                  (done, len(tasks), forum_id, topics, posts, changed))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-        for forum in Forum.objects.all():
-            forum.update_counters()
-            self.stdout.write('Successfully updated forum "%s"\n' % forum)
+        elapsed = max(time.time() - started, 0.001)
+        self.stdout.write('Successfully updated %d forums, %d topics, %d posts in %.1fs (%.0f topics/s)\n' %
+                          (len(tasks), total_topics, total_posts, elapsed, total_topics / elapsed))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pybb', '0005_denormalized_last_posts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='position',
+            field=models.PositiveIntegerField(default=0, verbose_name='Position', editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('topic', 'position')]),
+        ),
+    ]
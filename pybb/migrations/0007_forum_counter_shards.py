@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pybb', '0006_post_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForumCounterShard',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='Slot')),
+                ('post_count', models.IntegerField(default=0, verbose_name='Post count')),
+                ('topic_count', models.IntegerField(default=0, verbose_name='Topic count')),
+                ('updated', models.DateTimeField(null=True, verbose_name='Updated', blank=True)),
+                ('forum', models.ForeignKey(related_name='counter_shards', verbose_name='Forum', to='pybb.Forum')),
+                ('last_post', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, verbose_name='Last post', blank=True, to='pybb.Post', null=True)),
+            ],
+            options={
+                'verbose_name': 'Forum counter shard',
+                'verbose_name_plural': 'Forum counter shards',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='forumcountershard',
+            unique_together=set([('forum', 'slot')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pybb', '0007_forum_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForumReadState',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('time_stamp', models.DateTimeField(null=True, blank=True)),
+                ('topics', models.TextField(default='', blank=True)),
+                ('forum', models.ForeignKey(to='pybb.Forum')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Forum read state',
+                'verbose_name_plural': 'Forum read states',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='forumreadstate',
+            unique_together=set([('user', 'forum')]),
+        ),
+    ]
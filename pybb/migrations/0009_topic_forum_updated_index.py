@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pybb', '0008_forum_read_state'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='topic',
+            index_together=set([('forum', 'updated')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def recount_topic_count(apps, schema_editor):
+    """
+    Forum.topic_count includes only topics with posts now
+    """
+    Forum = apps.get_model("pybb", "Forum")
+    Topic = apps.get_model("pybb", "Topic")
+    ForumCounterShard = apps.get_model("pybb", "ForumCounterShard")
+
+    counts = dict(Topic.objects.filter(post_count__gt=0).values_list('forum').annotate(models.Count('id')))
+    for forum_id, topic_count in Forum.objects.values_list('id', 'topic_count'):
+        if counts.get(forum_id, 0) != topic_count:
+            Forum.objects.filter(id=forum_id).update(topic_count=counts.get(forum_id, 0))
+    # shards keep deltas to forum counters, which are exact now
+    ForumCounterShard.objects.exclude(topic_count=0).update(topic_count=0)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pybb', '0009_topic_forum_updated_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_topic_count, noop),
+    ]
@@ -1,16 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import copy
+import random
+
+import django
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.db import models, transaction, DatabaseError
+from django.db.models import F, Q, Max, Min
 from django.utils.encoding import python_2_unicode_compatible
-from django.utils.functional import cached_property
 from django.utils.html import strip_tags
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now as tznow
 
-from pybb.compat import get_user_model_path, get_username_field, get_atomic_func, slugify
+from pybb.compat import get_user_model_path, get_username_field, get_atomic_func, slugify, bulk_upsert, \
+    bulk_update
 from pybb import defaults
 from pybb.profiles import PybbProfile
 from pybb.util import unescape, FilePathGenerator, _get_markup_formatter
@@ -26,6 +31,38 @@ except ImportError:
     pass
 
 
+class TrackedFieldsMixin(object):
+    """
+    Keeps values of `tracked_fields` (attribute names) as they were loaded from database,
+    so `save` can find out what was changed without reading the old object again.
+    """
+    tracked_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super(TrackedFieldsMixin, self).__init__(*args, **kwargs)
+        self.snapshot_tracked_fields()
+
+    def snapshot_tracked_fields(self):
+        if self.pk is None:
+            self._loaded_values = {}
+        else:
+            # deferred fields are not in instance dict, they will be read on demand
+            self._loaded_values = dict((name, self.__dict__[name]) for name in self.tracked_fields
+                                       if name in self.__dict__)
+
+    def get_loaded_value(self, name):
+        """
+        Value of tracked field as it was loaded from database
+        """
+        if name not in self._loaded_values:
+            self._loaded_values[name] = type(self)._default_manager.filter(pk=self.pk)\
+                .values_list(name, flat=True)[0]
+        return self._loaded_values[name]
+
+    def field_changed(self, name):
+        return self.pk is None or self.get_loaded_value(name) != getattr(self, name)
+
+
 @python_2_unicode_compatible
 class Category(models.Model):
     name = models.CharField(_('Name'), max_length=80)
@@ -75,6 +112,8 @@ class Forum(models.Model):
     readed_by = models.ManyToManyField(get_user_model_path(), through='ForumReadTracker', related_name='readed_forums')
     headline = models.TextField(_('Headline'), blank=True, null=True)
     slug = models.SlugField(verbose_name=_("Slug"), max_length=255)
+    last_post = models.ForeignKey('Post', related_name='+', verbose_name=_('Last post'), blank=True, null=True,
+                                  on_delete=models.SET_NULL)
 
     class Meta(object):
         ordering = ['position']
@@ -86,19 +125,97 @@ class Forum(models.Model):
         return self.name
 
     def update_counters(self):
-        self.topic_count = Topic.objects.filter(forum=self).count()
+        """
+        Full recount of forum counters. Regular posting keeps counters up to date
+        with `adjust_counters`, so this is only needed to repair them
+        (see `pybb_update_counters` management command).
+        """
+        self.topic_count = Topic.objects.filter(forum=self, post_count__gt=0).count()
+        self.last_post = None
         if self.topic_count:
             posts = Post.objects.filter(topic__forum_id=self.id)
             self.post_count = posts.count()
             if self.post_count:
                 try:
-                    last_post = posts.order_by('-created', '-id')[0]
-                    self.updated = last_post.updated or last_post.created
+                    self.last_post = posts.order_by('-created', '-id')[0]
+                    self.updated = self.last_post.updated or self.last_post.created
                 except IndexError:
                     pass
         else:
             self.post_count = 0
         self.save()
+        ForumCounterShard.objects.filter(forum=self).delete()
+
+    def adjust_counters(self, post_delta=0, topic_delta=0, updated=None, last_post=None):
+        """
+        Apply counter deltas with atomic UPDATE statements instead of recounting all
+        forum posts. `updated` (and `last_post` which caused it) can only move
+        forum's last activity forward.
+        With PYBB_FORUM_COUNTER_SHARDS deltas are written to a counter shard instead of forum row.
+        """
+        if defaults.PYBB_FORUM_COUNTER_SHARDS:
+            ForumCounterShard.objects.adjust(self, post_delta, topic_delta, updated, last_post)
+            self.post_count += post_delta
+            self.topic_count += topic_delta
+            if updated is not None and (self.updated is None or self.updated < updated):
+                self.updated = updated
+                if last_post is not None:
+                    self.last_post = last_post
+            return
+        changes = {}
+        if post_delta:
+            changes['post_count'] = F('post_count') + post_delta
+        if topic_delta:
+            changes['topic_count'] = F('topic_count') + topic_delta
+        if changes:
+            Forum.objects.filter(pk=self.pk).update(**changes)
+        self.post_count += post_delta
+        self.topic_count += topic_delta
+        if updated is not None:
+            changes = {'updated': updated}
+            if last_post is not None:
+                changes['last_post'] = last_post
+            Forum.objects.filter(Q(updated__isnull=True) | Q(updated__lt=updated), pk=self.pk).update(**changes)
+            if self.updated is None or self.updated < updated:
+                self.updated = updated
+                if last_post is not None:
+                    self.last_post = last_post
+
+    def get_latest_activity(self):
+        """
+        Last activity date of the forum, not folded counter shards included
+        """
+        updated = [self.updated]
+        if defaults.PYBB_FORUM_COUNTER_SHARDS:
+            updated.append(ForumCounterShard.objects.filter(forum=self).aggregate(Max('updated'))['updated__max'])
+        updated = [value for value in updated if value is not None]
+        return max(updated) if updated else None
+
+    def refresh_last_post(self, removed=None):
+        """
+        Set forum's last post and last activity date from its latest updated topic.
+        Used when the post which defined them is deleted or moved away: `removed` is the last activity
+        date of removed posts, forum is not changed if it has later activity.
+        """
+        if removed is not None:
+            latest = self.get_latest_activity()
+            if latest is not None and removed < latest:
+                return
+        if defaults.PYBB_FORUM_COUNTER_SHARDS:
+            # only the shard which got the removed activity refers to it
+            shards = ForumCounterShard.objects.filter(forum=self, updated__isnull=False)
+            if removed is not None:
+                shards = shards.filter(updated__gte=removed)
+            shards.update(updated=None, last_post=None)
+        # topics keep their last activity, so only one row of (forum, updated) index is read
+        topic = (list(self.topics.filter(post_count__gt=0).order_by('-updated').select_related('last_post')[:1]) or
+                 [None])[0]
+        if topic is None:
+            self.last_post = None
+            Forum.objects.filter(pk=self.pk).update(last_post=None)
+            return
+        self.last_post, self.updated = topic.last_post, topic.updated
+        Forum.objects.filter(pk=self.pk).update(last_post=self.last_post, updated=self.updated)
 
     def get_absolute_url(self):
         if defaults.PYBB_NICE_URL:
@@ -109,13 +226,6 @@ class Forum(models.Model):
     def posts(self):
         return Post.objects.filter(topic__forum=self).select_related()
 
-    @cached_property
-    def last_post(self):
-        try:
-            return self.posts.order_by('-created', '-id')[0]
-        except IndexError:
-            return None
-
     def get_parents(self):
         """
         Used in templates for breadcrumb building
@@ -129,7 +239,7 @@ class Forum(models.Model):
 
 
 @python_2_unicode_compatible
-class Topic(models.Model):
+class Topic(TrackedFieldsMixin, models.Model):
     POLL_TYPE_NONE = 0
     POLL_TYPE_SINGLE = 1
     POLL_TYPE_MULTIPLE = 2
@@ -156,25 +266,49 @@ class Topic(models.Model):
     poll_type = models.IntegerField(_('Poll type'), choices=POLL_TYPE_CHOICES, default=POLL_TYPE_NONE)
     poll_question = models.TextField(_('Poll question'), blank=True, null=True)
     slug = models.SlugField(verbose_name=_("Slug"), max_length=255)
+    first_post = models.ForeignKey('Post', related_name='+', verbose_name=_('First post'), blank=True, null=True,
+                                   on_delete=models.SET_NULL)
+    last_post = models.ForeignKey('Post', related_name='+', verbose_name=_('Last post'), blank=True, null=True,
+                                  on_delete=models.SET_NULL)
+
+    tracked_fields = ('forum_id', 'post_count', 'updated', 'first_post_id', 'last_post_id')
+    # maintained with atomic UPDATEs (see `adjust_counters`), `save` writes them only if they were changed
+    # explicitly, so stale values of topic loaded before concurrent posting don't overwrite them
+    counter_fields = ('post_count', 'updated', 'first_post', 'last_post')
 
     class Meta(object):
         ordering = ['-created']
         verbose_name = _('Topic')
         verbose_name_plural = _('Topics')
         unique_together = ('forum', 'slug')
+        if django.VERSION >= (1, 5):
+            index_together = [('forum', 'updated')]
 
     def __str__(self):
         return self.name
 
-    @cached_property
+    @property
     def head(self):
+        if self.first_post_id is None:
+            # not filled yet, see `pybb_update_counters` management command
+            self.first_post = self.get_first_post()
+        return self.first_post
+
+    @property
+    def has_post_positions(self):
+        """
+        True if `Post.position` is filled for posts of this topic,
+        see `pybb_update_counters` management command
+        """
+        return self.last_post_id is not None and self.last_post.position == self.post_count
+
+    def get_first_post(self):
         try:
             return self.posts.all().order_by('created', 'id')[0]
         except IndexError:
             return None
 
-    @cached_property
-    def last_post(self):
+    def get_last_post(self):
         try:
             return self.posts.order_by('-created', '-id').select_related('user')[0]
         except IndexError:
@@ -189,31 +323,94 @@ class Topic(models.Model):
         if self.id is None:
             self.created = self.updated = tznow()
 
-        forum_changed = False
-        old_topic = None
-        if self.id is not None:
-            old_topic = Topic.objects.get(id=self.id)
-            if self.forum != old_topic.forum:
-                forum_changed = True
+        old_forum_id = None
+        if self.id is not None and self.field_changed('forum_id'):
+            old_forum_id = self.get_loaded_value('forum_id')
 
-        super(Topic, self).save(*args, **kwargs)
+        if self.id is not None and django.VERSION >= (1, 5) and not kwargs.get('force_insert') and \
+                'update_fields' not in kwargs:
+            kwargs['update_fields'] = [field.name for field in self._meta.fields if not field.primary_key and
+                                       (field.name not in self.counter_fields or self.field_changed(field.attname))]
 
-        if forum_changed:
-            old_topic.forum.update_counters()
-            self.forum.update_counters()
+        super(Topic, self).save(*args, **kwargs)
+        self.snapshot_tracked_fields()
+
+        if old_forum_id is not None:
+            # read counters from db, posts could be added since this instance was loaded
+            post_count, updated = Topic.objects.filter(pk=self.pk).values_list('post_count', 'updated')[0]
+            if post_count:
+                old_forum = Forum.objects.get(pk=old_forum_id)
+                old_forum.adjust_counters(post_delta=-post_count, topic_delta=-1)
+                old_forum.refresh_last_post(removed=updated)
+                self.forum.adjust_counters(post_delta=post_count, topic_delta=1, updated=updated,
+                                           last_post=self.last_post)
 
     def delete(self, using=None):
+        # read counter from db, posts could be added since this instance was loaded
+        post_count = Topic.objects.filter(pk=self.pk).values_list('post_count', flat=True)[0]
         super(Topic, self).delete(using)
-        self.forum.update_counters()
+        if post_count:
+            self.forum.adjust_counters(post_delta=-post_count, topic_delta=-1)
+            if self.updated is not None:
+                self.forum.refresh_last_post(removed=self.updated)
 
     def update_counters(self):
+        """
+        Full recount of topic counters, see `Forum.update_counters`.
+        """
         self.post_count = self.posts.count()
-        # force cache overwrite to get the real latest updated post
-        if hasattr(self, 'last_post'):
-            del self.last_post
+        self.first_post = self.get_first_post()
+        self.last_post = self.get_last_post()
         if self.last_post:
             self.updated = self.last_post.updated or self.last_post.created
-        self.save()
+        Topic.objects.filter(pk=self.pk).update(post_count=self.post_count, first_post=self.first_post,
+                                                last_post=self.last_post, updated=self.updated)
+        self.counters_stored()
+
+    def counters_stored(self):
+        """
+        Mark in-memory counters as stored in database, after they were changed along with UPDATE queries
+        """
+        for name in ('post_count', 'updated', 'first_post_id', 'last_post_id'):
+            self._loaded_values[name] = getattr(self, name)
+
+    def adjust_counters(self, post_delta=0, updated=None, last_post=None):
+        """
+        Apply post counter delta with atomic UPDATE statements, see `Forum.adjust_counters`.
+        """
+        if post_delta:
+            Topic.objects.filter(pk=self.pk).update(post_count=F('post_count') + post_delta)
+            self.post_count += post_delta
+        if updated is not None:
+            changes = {'updated': updated}
+            if last_post is not None:
+                changes['last_post'] = last_post
+            Topic.objects.filter(Q(updated__isnull=True) | Q(updated__lt=updated), pk=self.pk).update(**changes)
+            if self.updated is None or self.updated < updated:
+                self.updated = updated
+                if last_post is not None:
+                    self.last_post = last_post
+        self.counters_stored()
+
+    def refresh_first_post(self):
+        """
+        Set topic's first post, used when it is moved away.
+        """
+        self.first_post = self.get_first_post()
+        Topic.objects.filter(pk=self.pk).update(first_post=self.first_post)
+        self.counters_stored()
+
+    def refresh_last_post(self):
+        """
+        Set topic's last post and last activity date from its latest post, see `Forum.refresh_last_post`.
+        """
+        self.last_post = self.get_last_post()
+        if self.last_post:
+            self.updated = self.last_post.updated or self.last_post.created
+            Topic.objects.filter(pk=self.pk).update(last_post=self.last_post, updated=self.updated)
+        else:
+            Topic.objects.filter(pk=self.pk).update(last_post=None)
+        self.counters_stored()
 
     def get_parents(self):
         """
@@ -250,19 +447,50 @@ class RenderableItem(models.Model):
         self.body_text = unescape(text)
 
 
+def lock_topics(*topic_ids):
+    """
+    Lock rows of topics until the end of transaction, so positions of their posts are changed by one
+    transaction at a time. Rows are locked in order of ids to avoid deadlocks.
+    """
+    list(Topic.objects.select_for_update().filter(pk__in=sorted(set(topic_ids))).values_list('pk', flat=True))
+
+
+def renumber_posts(topic_ids, chunk_size=500):
+    """
+    Fill dense `Post.position` for all posts of given topics
+    """
+    rows = {}
+    position, last_topic_id = 0, None
+    for post_id, topic_id, old_position in Post.objects.filter(topic_id__in=topic_ids)\
+            .order_by('topic_id', 'created', 'id').values_list('id', 'topic_id', 'position'):
+        position = position + 1 if topic_id == last_topic_id else 1
+        last_topic_id = topic_id
+        if position != old_position:
+            rows[post_id] = {'position': position}
+    post_ids = list(rows.keys())
+    for start in range(0, len(post_ids), chunk_size):
+        with get_atomic_func()():
+            bulk_update(Post, dict((pk, rows[pk]) for pk in post_ids[start:start + chunk_size]), ['position'])
+
+
 @python_2_unicode_compatible
-class Post(RenderableItem):
+class Post(TrackedFieldsMixin, RenderableItem):
     topic = models.ForeignKey(Topic, related_name='posts', verbose_name=_('Topic'))
     user = models.ForeignKey(get_user_model_path(), related_name='posts', verbose_name=_('User'))
     created = models.DateTimeField(_('Created'), blank=True, db_index=True)
     updated = models.DateTimeField(_('Updated'), blank=True, null=True)
     user_ip = models.IPAddressField(_('User IP'), blank=True, default='0.0.0.0')
     on_moderation = models.BooleanField(_('On moderation'), default=False)
+    position = models.PositiveIntegerField(_('Position'), default=0, editable=False)
+
+    tracked_fields = ('topic_id', 'body', 'updated', 'position')
 
     class Meta(object):
         ordering = ['created']
         verbose_name = _('Post')
         verbose_name_plural = _('Posts')
+        if django.VERSION >= (1, 5):
+            index_together = [('topic', 'position')]
 
     def summary(self):
         limit = 50
@@ -273,46 +501,120 @@ class Post(RenderableItem):
         return self.summary()
 
     def save(self, *args, **kwargs):
-        created_at = tznow()
-        if self.created is None:
-            self.created = created_at
-        self.render()
-
-        new = self.pk is None
-
-        topic_changed = False
-        old_post = None
-        if not new:
-            old_post = Post.objects.get(pk=self.pk)
-            if old_post.topic != self.topic:
-                topic_changed = True
-
-        super(Post, self).save(*args, **kwargs)
-
-        # If post is topic head and moderated, moderate topic too
-        if self.topic.head == self and not self.on_moderation and self.topic.on_moderation:
-            self.topic.on_moderation = False
-
-        self.topic.update_counters()
-        self.topic.forum.update_counters()
+        with get_atomic_func()():
+            created_at = tznow()
+            if self.created is None:
+                self.created = created_at
+            if self.field_changed('body'):
+                self.render()
+
+            new = self.pk is None
+
+            old_post = None
+            if not new and self.field_changed('topic_id'):
+                # post is moved, old post is used to remove it from the old topic
+                old_topic_id = self.get_loaded_value('topic_id')
+                lock_topics(old_topic_id, self.topic_id)
+                old_post = copy.copy(self)
+                old_post.topic = Topic.objects.get(pk=old_topic_id)
+                # stored position, loaded one is stale if other posts of the topic were moved meanwhile
+                old_post.position = Post.objects.filter(pk=self.pk).values_list('position', flat=True)[0]
+                old_post.updated = self.get_loaded_value('updated')
+            elif new:
+                lock_topics(self.topic_id)
+
+            if new or old_post is not None:
+                self._take_position(self.topic)
+            updated_changed = not new and self.field_changed('updated')
+
+            super(Post, self).save(*args, **kwargs)
+            self.snapshot_tracked_fields()
+
+            if new:
+                self._add_to_topic(self.topic)
+            elif old_post is not None:
+                old_post._remove_from_topic(old_post.topic)
+                self._add_to_topic(self.topic)
+            elif updated_changed and self.updated and self.topic.last_post_id == self.pk:
+                # last post of the topic was edited
+                self.topic.adjust_counters(updated=self.updated, last_post=self)
+                self.topic.forum.adjust_counters(updated=self.updated, last_post=self)
+
+            # If post is topic head and moderated, moderate topic too
+            if self.topic.on_moderation and not self.on_moderation and self.topic.head == self:
+                self.topic.on_moderation = False
+                Topic.objects.filter(pk=self.topic_id).update(on_moderation=False)
+
+    def _add_to_topic(self, topic):
+        """
+        Count this post in topic and forum counters
+        """
+        # checked in database, loaded topic could be stale when posts are added concurrently
+        topic_was_empty = bool(Topic.objects.filter(pk=topic.pk, post_count=0).update(post_count=1))
+        if topic_was_empty:
+            topic.post_count = 1
+        if topic_was_empty or topic.first_post_id is None or (topic.updated and self.created < topic.updated):
+            # post is not the newest one, it could be the head of the topic
+            if Topic.objects.filter(Q(first_post__isnull=True) | Q(first_post__created__gt=self.created),
+                                    pk=topic.pk).update(first_post=self):
+                topic.first_post = self
+        topic.adjust_counters(post_delta=0 if topic_was_empty else 1, updated=self.updated or self.created,
+                              last_post=self)
+        topic.forum.adjust_counters(post_delta=1, topic_delta=int(topic_was_empty),
+                                    updated=self.updated or self.created, last_post=self)
+
+    def _take_position(self, topic):
+        """
+        Set position of this post in topic, posts created later are shifted down
+        """
+        later = topic.posts.filter(created__gt=self.created)
+        if self.pk is not None:
+            later = later.exclude(pk=self.pk)
+        position = later.aggregate(position=Min('position'))['position']
+        if position is None:
+            # the newest post, this is the usual case
+            position = (topic.posts.exclude(pk=self.pk).aggregate(position=Max('position'))['position'] or 0) + 1
+        else:
+            topic.posts.filter(position__gte=position).exclude(pk=self.pk).update(position=F('position') + 1)
+        self.position = position
 
-        if topic_changed:
-            old_post.topic.update_counters()
-            old_post.topic.forum.update_counters()
+    def _remove_from_topic(self, topic):
+        """
+        Discount this post from topic and forum counters
+        """
+        topic.posts.filter(position__gt=self.position).update(position=F('position') - 1)
+        # checked in database, loaded topic could be stale
+        topic_became_empty = bool(Topic.objects.filter(pk=topic.pk, post_count=1).update(post_count=0))
+        if topic_became_empty:
+            topic.post_count = 0
+        else:
+            topic.adjust_counters(post_delta=-1)
+        topic.forum.adjust_counters(post_delta=-1, topic_delta=-int(topic_became_empty))
+        if topic.first_post_id is None or topic.first_post_id == self.pk:
+            topic.refresh_first_post()
+        last_update = self.updated or self.created
+        if topic.updated is not None and last_update >= topic.updated:
+            topic.refresh_last_post()
+        topic.forum.refresh_last_post(removed=last_update)
+        topic.counters_stored()
 
     def get_absolute_url(self):
         return reverse('pybb:post', kwargs={'pk': self.id})
 
     def delete(self, *args, **kwargs):
-        self_id = self.id
-        head_post_id = self.topic.posts.order_by('created', 'id')[0].id
-
-        if self_id == head_post_id:
+        if self.topic.head == self:
             self.topic.delete()
-        else:
+            return
+        with get_atomic_func()():
+            lock_topics(self.topic_id)
+            # positions are shifted from stored one, loaded one is stale if other posts were deleted
+            positions = list(Post.objects.filter(pk=self.pk).values_list('position', flat=True))
+            if not positions:
+                # already deleted
+                return
+            self.position = positions[0]
             super(Post, self).delete(*args, **kwargs)
-            self.topic.update_counters()
-            self.topic.forum.update_counters()
+            self._remove_from_topic(self.topic)
 
     def get_parents(self):
         """
@@ -384,6 +686,51 @@ class TopicReadTrackerManager(models.Manager):
             is_new = False
         return obj, is_new
 
+    def update_or_create_trackers(self, user, topics, time_stamp=None):
+        """
+        Set read time of `topics` for `user` to `time_stamp` (now by default, or {topic id: time} to set
+        own time for each topic) with single upsert statement
+        """
+        if not isinstance(time_stamp, dict):
+            time_stamp = dict.fromkeys([topic.id for topic in topics], time_stamp or tznow())
+        bulk_upsert(TopicReadTracker, [{'user': user, 'topic': topic, 'time_stamp': time_stamp[topic.id]}
+                                       for topic in topics],
+                    unique_fields=('user', 'topic'), update_fields=('time_stamp',))
+
+    def get_marks(self, user, topics):
+        """
+        Return {topic id: read time} for `topics` read by `user`, stored by active read tracking backend
+        """
+        from pybb.read_tracking import get_read_tracking
+        return get_read_tracking().get_topic_marks(user, topics)
+
+    def get_read_time(self, user, topic):
+        """
+        Return time when `user` read `topic` or its forum, None if topic was never read
+        """
+        from pybb.read_tracking import get_read_tracking
+        return get_read_tracking().get_read_time(user, topic)
+
+    def get_first_unread_post(self, user, topic, posts):
+        """
+        Return the first post of `posts` queryset (posts of `topic`) unread by `user`, None if all are read
+        """
+        from pybb.read_tracking import get_read_tracking
+        return get_read_tracking().get_first_unread_post(user, topic, posts)
+
+    def filter_unread(self, user, topics, forums):
+        """
+        Filter `topics` queryset to topics of `forums` unread by `user`
+        """
+        from pybb.read_tracking import get_read_tracking
+        return get_read_tracking().filter_unread_topics(user, topics, forums)
+
+    def mark_read(self, user, topic):
+        from pybb.read_tracking import get_read_tracking, reset_unread_resolver, touch_marks_version
+        get_read_tracking().mark_topic_read(user, topic)
+        reset_unread_resolver(user)
+        touch_marks_version(user.pk)
+
 
 class TopicReadTracker(models.Model):
     """
@@ -422,6 +769,27 @@ class ForumReadTrackerManager(models.Manager):
             obj = ForumReadTracker.objects.get(user=user, forum=forum)
         return obj, is_new
 
+    def update_or_create_trackers(self, user, forums, time_stamp=None):
+        """
+        Set read time of `forums` for `user` to `time_stamp` (now by default) with single upsert statement
+        """
+        time_stamp = time_stamp or tznow()
+        bulk_upsert(ForumReadTracker, [{'user': user, 'forum': forum, 'time_stamp': time_stamp} for forum in forums],
+                    unique_fields=('user', 'forum'), update_fields=('time_stamp',))
+
+    def get_marks(self, user, forums):
+        """
+        Return {forum id: read time} for `forums` read by `user`, stored by active read tracking backend
+        """
+        from pybb.read_tracking import get_read_tracking
+        return get_read_tracking().get_forum_marks(user, forums)
+
+    def mark_read(self, user, forums):
+        from pybb.read_tracking import get_read_tracking, reset_unread_resolver, touch_marks_version
+        get_read_tracking().mark_forums_read(user, forums)
+        reset_unread_resolver(user)
+        touch_marks_version(user.pk)
+
 
 class ForumReadTracker(models.Model):
     """
@@ -439,6 +807,138 @@ class ForumReadTracker(models.Model):
         unique_together = ('user', 'forum')
 
 
+class ForumReadStateManager(models.Manager):
+    def get_or_create_state(self, user, forum):
+        """
+        Same as `ForumReadTrackerManager.get_or_create_tracker` for compact read state
+        """
+        is_new = True
+        sid = transaction.savepoint(using=self.db)
+        try:
+            with get_atomic_func()():
+                obj = ForumReadState.objects.create(user=user, forum=forum)
+            transaction.savepoint_commit(sid)
+        except DatabaseError:
+            transaction.savepoint_rollback(sid)
+            is_new = False
+            obj = ForumReadState.objects.get(user=user, forum=forum)
+        return obj, is_new
+
+    def update_or_create_states(self, user, forums, time_stamp):
+        """
+        Mark `forums` as read by `user` at `time_stamp` and drop their topic marks with single upsert statement
+        """
+        bulk_upsert(ForumReadState, [{'user': user, 'forum': forum, 'time_stamp': time_stamp, 'topics': ''}
+                                     for forum in forums],
+                    unique_fields=('user', 'forum'), update_fields=('time_stamp', 'topics'))
+
+
+class ForumReadState(models.Model):
+    """
+    Compact per user forum read tracking used by `pybb.read_tracking.CompactReadTracking`:
+    time when the whole forum was read and packed read times of topics read after it
+    """
+    user = models.ForeignKey(get_user_model_path(), blank=False, null=False)
+    forum = models.ForeignKey(Forum, blank=False, null=False)
+    time_stamp = models.DateTimeField(blank=True, null=True)
+    topics = models.TextField(blank=True, default='')
+
+    objects = ForumReadStateManager()
+
+    class Meta(object):
+        verbose_name = _('Forum read state')
+        verbose_name_plural = _('Forum read states')
+        unique_together = ('user', 'forum')
+
+
+class ForumCounterShardManager(models.Manager):
+    def adjust(self, forum, post_delta=0, topic_delta=0, updated=None, last_post=None):
+        """
+        Apply forum counter deltas to a random counter shard of the forum,
+        so concurrent posters don't wait for lock of the same forum row
+        """
+        slot = random.randrange(defaults.PYBB_FORUM_COUNTER_SHARDS)
+        qs = self.filter(forum=forum, slot=slot)
+        changes = {'post_count': F('post_count') + post_delta, 'topic_count': F('topic_count') + topic_delta}
+        if not qs.update(**changes):
+            sid = transaction.savepoint(using=self.db)
+            try:
+                with get_atomic_func()():
+                    self.create(forum=forum, slot=slot, post_count=post_delta, topic_count=topic_delta)
+                transaction.savepoint_commit(sid)
+            except DatabaseError:
+                transaction.savepoint_rollback(sid)
+                qs.update(**changes)
+        if updated is not None:
+            changes = {'updated': updated}
+            if last_post is not None:
+                changes['last_post'] = last_post
+            qs.filter(Q(updated__isnull=True) | Q(updated__lt=updated)).update(**changes)
+
+    def apply(self, forums):
+        """
+        Add not folded counter shards to counters of `forums` and return them as list.
+        Returned forums show actual counters but must not be saved.
+        """
+        if not defaults.PYBB_FORUM_COUNTER_SHARDS:
+            return forums
+        forums = list(forums)
+        forum_dict = dict((forum.id, forum) for forum in forums)
+        shards = self.filter(forum__in=list(forum_dict.keys())).select_related('last_post', 'last_post__user')
+        for shard in shards:
+            forum = forum_dict[shard.forum_id]
+            forum.post_count += shard.post_count
+            forum.topic_count += shard.topic_count
+            if shard.updated is not None and (forum.updated is None or forum.updated < shard.updated):
+                forum.updated = shard.updated
+                forum.last_post = shard.last_post
+        return forums
+
+    def fold(self, forum_ids=None):
+        """
+        Move counters accumulated in shards to forum rows. Returns number of folded shards
+        """
+        shards = self.all()
+        if forum_ids is not None:
+            shards = shards.filter(forum__in=forum_ids)
+        folded = 0
+        for shard in shards.order_by('forum', 'slot'):
+            with get_atomic_func()():
+                # subtract exactly what is added to forum, shard may be changed concurrently
+                self.filter(pk=shard.pk).update(post_count=F('post_count') - shard.post_count,
+                                                topic_count=F('topic_count') - shard.topic_count)
+                Forum.objects.filter(pk=shard.forum_id).update(post_count=F('post_count') + shard.post_count,
+                                                               topic_count=F('topic_count') + shard.topic_count)
+                if shard.updated is not None:
+                    changes = {'updated': shard.updated}
+                    if shard.last_post_id is not None:
+                        changes['last_post'] = shard.last_post_id
+                    Forum.objects.filter(Q(updated__isnull=True) | Q(updated__lt=shard.updated),
+                                         pk=shard.forum_id).update(**changes)
+            folded += 1
+        return folded
+
+
+class ForumCounterShard(models.Model):
+    """
+    Part of forum counters not yet folded into forum row, see PYBB_FORUM_COUNTER_SHARDS setting
+    """
+    forum = models.ForeignKey(Forum, related_name='counter_shards', verbose_name=_('Forum'))
+    slot = models.PositiveSmallIntegerField(_('Slot'))
+    post_count = models.IntegerField(_('Post count'), default=0)
+    topic_count = models.IntegerField(_('Topic count'), default=0)
+    updated = models.DateTimeField(_('Updated'), blank=True, null=True)
+    last_post = models.ForeignKey('Post', related_name='+', verbose_name=_('Last post'), blank=True, null=True,
+                                  on_delete=models.SET_NULL)
+
+    objects = ForumCounterShardManager()
+
+    class Meta(object):
+        verbose_name = _('Forum counter shard')
+        verbose_name_plural = _('Forum counter shards')
+        unique_together = ('forum', 'slot')
+
+
 @python_2_unicode_compatible
 class PollAnswer(models.Model):
     topic = models.ForeignKey(Topic, related_name='poll_answers', verbose_name=_('Topic'))
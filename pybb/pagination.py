@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import base64
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db.models import Q
+
+from pybb import compat, util
+
+
+Paginator, pure_pagination = compat.get_paginator_class()
+
+
+class PositionPaginator(Paginator):
+    """
+    Paginator for posts of one topic which selects a page by `Post.position` range
+    instead of OFFSET. Queryset must contain all posts of topic and their positions
+    must be filled (see `Topic.has_post_positions`).
+    """
+    def page(self, number):
+        page = super(PositionPaginator, self).page(number)
+        bottom = (page.number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        page.object_list = self.object_list.filter(position__gt=bottom, position__lte=top)
+        return page
+
+
+class KeysetPage(object):
+    """
+    Page of `KeysetPaginator`. Page number is known only for pages requested by number
+    or found in cached anchors table.
+    """
+    def __init__(self, object_list, paginator, number=None, has_previous=False, has_next=False):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<Page %s>' % (self.number or '?')
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1])
+
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0])
+
+
+class KeysetPaginator(object):
+    """
+    Paginator which selects a page by a condition on sort key of the queryset instead of OFFSET.
+    `ordering` is a list of field names (with "-" for descending order) which identifies each row.
+    Pages are requested with cursor of the last row of the previous page (`page_after`)
+    or of the first row of the next page (`page_before`).
+
+    Numbered pages are resolved through the anchors table: cursors of the last rows of all pages,
+    computed by one query over sort key columns and cached for `cache_timeout` seconds.
+    `cache_version` should change whenever rows are added to or removed from the queryset.
+    """
+    keyset = True
+
+    def __init__(self, object_list, per_page, ordering, cache_version='', cache_timeout=300):
+        self.object_list = object_list.order_by(*ordering)
+        self.per_page = int(per_page)
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.cache_version = cache_version
+        self.cache_timeout = cache_timeout
+        opts = self.object_list.model._meta
+        self.fields = [opts.pk if name == 'pk' else opts.get_field(name) for name, _ in self.ordering]
+
+    def encode_key(self, key):
+        values = []
+        for value in key:
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            elif isinstance(value, bool):
+                value = int(value)
+            values.append(value)
+        cursor = base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode('utf-8'))
+        return cursor.decode('ascii').rstrip('=')
+
+    def encode_cursor(self, obj):
+        return self.encode_key([getattr(obj, field.attname) for field in self.fields])
+
+    def decode_cursor(self, cursor):
+        try:
+            cursor = str(cursor)
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            key = [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (ValueError, TypeError, UnicodeError, ValidationError):
+            raise PageNotAnInteger('Wrong page cursor')
+        if None in key:
+            raise PageNotAnInteger('Wrong page cursor')
+        return key
+
+    def _seek(self, key, backward=False):
+        """
+        Condition for rows following the row with `key` in queryset order (or preceding it if `backward`)
+        """
+        condition = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            q = Q(**{'%s__%s' % (name, 'gt' if descending == backward else 'lt'): key[i]})
+            for j in range(i):
+                q &= Q(**{self.ordering[j][0]: key[j]})
+            condition |= q
+        return condition
+
+    def get_rows(self, key=None, backward=False, count=None):
+        """
+        Up to `count` rows following the row with `key` in queryset order
+        (or preceding it, nearest first, if `backward`)
+        """
+        qs = self.object_list
+        if backward:
+            qs = qs.order_by(*[('%s' if descending else '-%s') % name for name, descending in self.ordering])
+        if key is not None:
+            qs = qs.filter(self._seek(key, backward=backward))
+        return list(qs[:count])
+
+    def iter_keys(self):
+        """ sort keys of all rows in queryset order """
+        return self.object_list.values_list(*[field.attname for field in self.fields]).iterator()
+
+    def page_after(self, cursor=None):
+        object_list = self.get_rows(self.decode_cursor(cursor) if cursor else None, count=self.per_page + 1)
+        page = KeysetPage(object_list[:self.per_page], self,
+                          has_previous=bool(cursor), has_next=len(object_list) > self.per_page)
+        if not cursor:
+            page.number = 1
+        else:
+            page.number = self._find_page_number(cursor, offset=2)
+        return page
+
+    def page_before(self, cursor):
+        object_list = self.get_rows(self.decode_cursor(cursor), backward=True, count=self.per_page + 1)
+        page = KeysetPage(object_list[:self.per_page][::-1], self,
+                          has_previous=len(object_list) > self.per_page, has_next=True)
+        if not page.has_previous():
+            page.number = 1
+        elif page.object_list:
+            page.number = self._find_page_number(self.encode_cursor(page.object_list[-1]), offset=1)
+        return page
+
+    def page(self, number):
+        """
+        Page by number, cursor of the previous page is taken from anchors table
+        """
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        if number == 1:
+            return self.page_after()
+        anchors = self.get_anchors()
+        if number - 2 >= len(anchors):
+            raise EmptyPage('That page contains no results')
+        page = self.page_after(anchors[number - 2])
+        page.number = number
+        return page
+
+    def _get_cache_key(self):
+        query = ('%s:%s' % (self.object_list.query, self.cache_version)).encode('utf-8')
+        return util.build_cache_key('page_anchors', query_hash=hashlib.md5(query).hexdigest(),
+                                    per_page=self.per_page)
+
+    def get_anchors(self):
+        """
+        Cursors of the last rows of all pages except the last one
+        """
+        cache_key = self._get_cache_key()
+        anchors = cache.get(cache_key)
+        if anchors is None:
+            anchors, count = [], 0
+            for count, key in enumerate(self.iter_keys(), 1):
+                if count % self.per_page == 0:
+                    anchors.append(self.encode_key(key))
+            if anchors and len(anchors) * self.per_page == count:
+                # there are no rows after the last anchor
+                anchors.pop()
+            cache.set(cache_key, anchors, self.cache_timeout)
+        return anchors
+
+    def _find_page_number(self, cursor, offset):
+        anchors = cache.get(self._get_cache_key())
+        if anchors and cursor in anchors:
+            return anchors.index(cursor) + offset
+        return None
+
+
+class UnreadTopicsPaginator(KeysetPaginator):
+    """
+    Keyset paginator of topics of `forums` unread by `user`, latest updates first. Rows are selected by
+    read tracking backend (see `BaseReadTracking.get_unread_topics`) instead of filtering the queryset.
+    """
+
+    def __init__(self, object_list, per_page, user, forums, **kwargs):
+        super(UnreadTopicsPaginator, self).__init__(object_list, per_page, ('-updated', '-id'), **kwargs)
+        self.user = user
+        self.forums = list(forums)
+
+    def get_rows(self, key=None, backward=False, count=None):
+        from pybb.read_tracking import get_read_tracking
+        return get_read_tracking().get_unread_topics(self.user, self.object_list, self.forums, count or self.per_page,
+                                                     key=key, backward=backward)
+
+    def iter_keys(self):
+        key, chunk_size = None, self.per_page * 10
+        while True:
+            rows = self.get_rows(key, count=chunk_size)
+            for row in rows:
+                key = (row.updated, row.id)
+                yield key
+            if len(rows) < chunk_size:
+                return
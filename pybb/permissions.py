@@ -61,6 +61,17 @@ class DefaultPermissionHandler(object):
                 qs = qs.filter(on_moderation=False)
         return qs
 
+    def may_view_all_topics(self, user, forum):
+        """
+        return True if `filter_topics` hides none of the topics of `forum` (which `user` may view),
+        so topics may be counted by forum counters. Returns False if `filter_topics` is overridden,
+        override this method too then.
+        """
+        if self._overridden('filter_topics'):
+            return False
+        # topics on moderation are hidden by `filter_topics` also when premoderation is turned off
+        return user.is_superuser or (user.is_authenticated() and user in forum.moderators.all())
+
     def may_view_topic(self, user, topic):
         """ return True if user may view this topic, False otherwise """
         if user.is_superuser:
@@ -142,6 +153,16 @@ class DefaultPermissionHandler(object):
             qs = qs.filter(on_moderation=False)
         return qs
 
+    def may_view_all_posts(self, user, topic):
+        """
+        return True if `filter_posts` hides none of the posts of `topic` (which `user` may view),
+        so posts may be counted by topic counters and paginated by their positions in topic.
+        Returns False if `filter_posts` is overridden, override this method too then.
+        """
+        if self._overridden('filter_posts'):
+            return False
+        return not defaults.PYBB_PREMODERATION or self.may_moderate_topic(user, topic)
+
     def may_view_post(self, user, post):
         """ return True if `user` may view `post`, False otherwise """
         if user.is_superuser:
@@ -187,5 +208,27 @@ class DefaultPermissionHandler(object):
         """
         return False
 
+    #
+    # shared caches
+    #
+    def get_cache_group(self, user):
+        """
+        return name of the group of users for which `filter_topics` and `filter_posts` return the same
+        objects as for `user`, so lists filtered for one of them (e.g. feeds) may be cached and shown to
+        others. Return None if such lists of `user` must not be shared.
+        Override it together with `filter_*` methods.
+        """
+        if user.is_superuser:
+            return 'superuser_staff' if user.is_staff else 'superuser'
+        if user.is_authenticated():
+            # authors and moderators see topics on moderation, also when premoderation is turned off
+            return None
+        return 'default'
+
+    def _overridden(self, name):
+        """ return True if method `name` of the default handler is overridden by subclass """
+        method = getattr(type(self), name)
+        return getattr(method, '__func__', method) is not DefaultPermissionHandler.__dict__[name]
+
 
 perms = util.resolve_class(defaults.PYBB_PERMISSION_HANDLER)
@@ -2,6 +2,7 @@
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.db import models
+from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
 from pybb import defaults, util
 from pybb.compat import get_image_field_class, get_username_field
@@ -48,6 +49,16 @@ class PybbProfile(models.Model):
         self.signature_html = util._get_markup_formatter()(self.signature)
         super(PybbProfile, self).save(*args, **kwargs)
 
+    def adjust_post_count(self, delta):
+        """
+        Change post counter by `delta` with single UPDATE query, without saving the whole profile
+        """
+        qs = type(self)._default_manager.filter(pk=self.pk)
+        if delta < 0:
+            qs = qs.filter(post_count__gte=-delta)
+        if qs.update(post_count=F('post_count') + delta):
+            self.post_count += delta
+
     @property
     def avatar_url(self):
         try:
@@ -0,0 +1,691 @@
+# -*- coding: utf-8 -*-
+"""
+Read tracking backends. Backend is selected by PYBB_READ_TRACKING_BACKEND setting and used through
+`TopicReadTracker.objects` and `ForumReadTracker.objects` managers.
+"""
+
+from __future__ import unicode_literals
+import base64
+import datetime
+import struct
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from pybb import defaults, util
+from pybb.compat import bulk_upsert, get_user_model
+from pybb.models import Forum, ForumCounterShard, Topic, TopicReadTracker, ForumReadTracker, ForumReadState
+
+
+class BaseReadTracking(object):
+    """
+    Interface of read tracking backend. A topic is read by user if it was not updated
+    after user read the topic or the whole forum.
+    """
+
+    def get_forum_marks(self, user, forums):
+        """ return {forum id: time when `user` read the whole forum} for given `forums` """
+        raise NotImplementedError
+
+    def get_topic_marks(self, user, topics):
+        """ return {topic id: time when `user` read the topic} for given `topics`, forum marks aren't applied """
+        raise NotImplementedError
+
+    def mark_topic_read(self, user, topic, time_stamp=None):
+        """
+        mark `topic` as read by `user` at `time_stamp` (now by default),
+        the whole forum is marked as read if there are no unread topics in it
+        """
+        raise NotImplementedError
+
+    def mark_topics_read(self, user, marks):
+        """
+        mark topics as read by `user`, `marks` is {topic: time_stamp}. Backends should override it
+        to write marks of many topics with fixed number of queries per forum.
+        """
+        for topic, time_stamp in sorted(marks.items(), key=lambda item: item[1]):
+            self.mark_topic_read(user, topic, time_stamp)
+
+    def mark_forums_read(self, user, forums, time_stamp=None):
+        """ mark all topics of `forums` as read by `user` at `time_stamp` (now by default) """
+        raise NotImplementedError
+
+    def get_read_topic_ids(self, user, forums):
+        """ return ids of topics of `forums` which `user` read after their last update """
+        raise NotImplementedError
+
+    def filter_unread_topics(self, user, topics, forums):
+        """
+        Filter `topics` queryset to topics of `forums` unread by `user`. Topics of each forum are selected
+        by range of (forum, updated) index after the forum mark, topics read after update are excluded.
+        """
+        forums = list(forums)
+        forum_marks = self.get_forum_marks(user, forums)
+        condition = Q(forum__in=[forum.id for forum in forums if forum.id not in forum_marks])
+        for forum_id, time_stamp in forum_marks.items():
+            condition |= Q(forum=forum_id, updated__gt=time_stamp)
+        return topics.filter(condition).exclude(id__in=list(self.get_read_topic_ids(user, forums)))
+
+    def get_unread_topics(self, user, topics, forums, count, key=None, backward=False):
+        """
+        Return up to `count` topics of `topics` queryset (topics of `forums`) unread by `user`, latest updates
+        first, following the (updated, id) `key` (or preceding it, nearest first, if `backward`).
+        Each forum is sought by range of (forum, updated) index after the forum mark and results are merged,
+        topic marks are checked only for the merged candidates, so queries don't grow with number of read marks.
+        """
+        forum_ids = [getattr(forum, 'id', forum) for forum in forums]
+        forum_marks = self.get_forum_marks(user, forum_ids)
+        lookup = 'gt' if backward else 'lt'
+        ordering = ('updated', 'id') if backward else ('-updated', '-id')
+
+        def sort_key(topic):
+            return topic.updated, topic.id
+
+        def seek(forum_id, after):
+            qs = topics.filter(forum=forum_id, updated__isnull=False)
+            if forum_id in forum_marks:
+                qs = qs.filter(updated__gt=forum_marks[forum_id])
+            if after is not None:
+                qs = qs.filter(Q(**{'updated__%s' % lookup: after[0]}) |
+                               Q(**{'updated': after[0], 'id__%s' % lookup: after[1]}))
+            return list(qs.order_by(*ordering)[:count])
+
+        candidates = dict((forum_id, []) for forum_id in forum_ids)
+        last_keys = dict.fromkeys(forum_ids, key)
+        exhausted = set()
+
+        def refill():
+            # every forum which may have more topics must have a candidate before the next one is taken
+            pending = [forum_id for forum_id in forum_ids if not candidates[forum_id] and forum_id not in exhausted]
+            while pending:
+                fetched = []
+                for forum_id in pending:
+                    rows = seek(forum_id, last_keys[forum_id])
+                    if len(rows) < count:
+                        exhausted.add(forum_id)
+                    if rows:
+                        last_keys[forum_id] = sort_key(rows[-1])
+                    fetched.extend(rows)
+                marks = self.get_topic_marks(user, fetched) if fetched else {}
+                for topic in fetched:
+                    if topic.id not in marks or marks[topic.id] < topic.updated:
+                        candidates[topic.forum_id].append(topic)
+                pending = [forum_id for forum_id in pending if not candidates[forum_id] and forum_id not in exhausted]
+
+        result = []
+        while len(result) < count:
+            refill()
+            heads = [rows[0] for rows in candidates.values() if rows]
+            if not heads:
+                break
+            topic = (min if backward else max)(heads, key=sort_key)
+            result.append(candidates[topic.forum_id].pop(0))
+        return result
+
+    def get_marked_forums(self):
+        """ return queryset of (user id, forum id) pairs which have topic marks """
+        raise NotImplementedError
+
+    def compact_forum_marks(self, user_id, forum_id, horizon=None):
+        """
+        Move forum mark of user as far as possible and drop topic marks covered by it.
+        Topic marks older than `horizon` are treated as read. Return number of dropped topic marks.
+        """
+        raise NotImplementedError
+
+    def get_first_unread_post(self, user, topic, posts):
+        """
+        Return the first post of `posts` queryset (posts of `topic`) created after `user` read the topic,
+        None if there are no such posts
+        """
+        read_time = self.get_read_time(user, topic)
+        if read_time is not None:
+            posts = posts.filter(created__gt=read_time)
+        return (list(posts.order_by('created', 'id')[:1]) or [None])[0]
+
+    def get_read_time(self, user, topic):
+        """ return time when `user` read `topic` or its forum, None if he didn't """
+        marks = [mark for mark in (self.get_forum_marks(user, [topic.forum_id]).get(topic.forum_id),
+                                   self.get_topic_marks(user, [topic]).get(topic.id)) if mark is not None]
+        return max(marks) if marks else None
+
+
+class RowReadTracking(BaseReadTracking):
+    """
+    Keeps one `TopicReadTracker` row per read topic and one `ForumReadTracker` row per read forum
+    """
+
+    def get_forum_marks(self, user, forums):
+        return dict(ForumReadTracker.objects.filter(user=user, forum__in=forums).values_list('forum_id', 'time_stamp'))
+
+    def get_topic_marks(self, user, topics):
+        return dict(TopicReadTracker.objects.filter(user=user, topic__in=topics).values_list('topic_id', 'time_stamp'))
+
+    def mark_topic_read(self, user, topic, time_stamp=None):
+        self.mark_topics_read(user, {topic: time_stamp or timezone.now()})
+
+    def mark_topics_read(self, user, marks):
+        forum_marks = self.get_forum_marks(user, set(topic.forum_id for topic in marks))
+        # topics updated after their forum was read
+        marks = dict((topic, time_stamp) for topic, time_stamp in marks.items()
+                     if topic.forum_id not in forum_marks or forum_marks[topic.forum_id] < topic.updated)
+        if not marks:
+            return
+        # Mark topics as readed
+        TopicReadTracker.objects.update_or_create_trackers(
+            user, list(marks.keys()), dict((topic.id, time_stamp) for topic, time_stamp in marks.items()))
+
+        for forum in set(topic.forum for topic in marks):
+            forum_mark = forum_marks.get(forum.id)
+            # Check, if there are any unread topics in forum
+            read_count = TopicReadTracker.objects.filter(user=user, topic__forum=forum,
+                                                         time_stamp__gte=F('topic__updated'))
+            if forum_mark is not None:
+                read_count = read_count.filter(topic__updated__gt=forum_mark)
+            if not has_more_updated_topics(forum, forum_mark, read_count.count()):
+                # Clear all topic marks for this forum, mark forum as readed
+                self.mark_forums_read(user, [forum], max(time_stamp for topic, time_stamp in marks.items()
+                                                          if topic.forum_id == forum.id))
+
+    def mark_forums_read(self, user, forums, time_stamp=None):
+        forums = list(forums)
+        ForumReadTracker.objects.update_or_create_trackers(user, forums, time_stamp)
+        TopicReadTracker.objects.filter(user=user, topic__forum__in=forums).delete()
+
+    def get_first_unread_post(self, user, topic, posts):
+        # both marks are checked in the same query with NOT EXISTS subqueries
+        qn = connections[posts.db].ops.quote_name
+        tables = {
+            'post': qn(posts.model._meta.db_table),
+            'created': qn(posts.model._meta.get_field('created').column),
+            'topic_mark': qn(TopicReadTracker._meta.db_table),
+            'forum_mark': qn(ForumReadTracker._meta.db_table),
+            'time_stamp': qn(TopicReadTracker._meta.get_field('time_stamp').column),
+        }
+        where = [
+            'NOT EXISTS (SELECT 1 FROM %(topic_mark)s WHERE %(topic_mark)s.user_id = %%s AND '
+            '%(topic_mark)s.topic_id = %%s AND %(topic_mark)s.%(time_stamp)s >= %(post)s.%(created)s)' % tables,
+            'NOT EXISTS (SELECT 1 FROM %(forum_mark)s WHERE %(forum_mark)s.user_id = %%s AND '
+            '%(forum_mark)s.forum_id = %%s AND %(forum_mark)s.%(time_stamp)s >= %(post)s.%(created)s)' % tables,
+        ]
+        posts = posts.extra(where=where, params=[user.pk, topic.pk, user.pk, topic.forum_id])
+        return (list(posts.order_by('created', 'id')[:1]) or [None])[0]
+
+    def get_read_topic_ids(self, user, forums):
+        return TopicReadTracker.objects.filter(user=user, topic__forum__in=forums, time_stamp__gte=F('topic__updated'))\
+            .values_list('topic', flat=True)
+
+    def get_marked_forums(self):
+        return TopicReadTracker.objects.order_by('user', 'topic__forum').values_list('user', 'topic__forum').distinct()
+
+    def compact_forum_marks(self, user_id, forum_id, horizon=None):
+        forum_marks = ForumReadTracker.objects.filter(user=user_id, forum=forum_id)
+        forum_mark = read_since = (list(forum_marks.values_list('time_stamp', flat=True)[:1]) or [None])[0]
+        marks = TopicReadTracker.objects.filter(user=user_id, topic__forum=forum_id)
+        rows = list(marks.values_list('topic', 'time_stamp', 'topic__updated'))
+        if horizon is not None and (read_since is None or read_since < horizon) and \
+                any(time_stamp < horizon for topic_id, time_stamp, updated in rows):
+            read_since = horizon
+        read_until = get_read_until(forum_id, read_since, [topic_id for topic_id, time_stamp, updated in rows
+                                                           if updated is not None and time_stamp >= updated])
+        if read_until is None:
+            return 0
+        if read_until != forum_mark:
+            ForumReadTracker.objects.update_or_create_trackers(user_id, [forum_id], read_until)
+            # stored value could be truncated by database
+            read_until = forum_marks.values_list('time_stamp', flat=True)[0]
+        obsolete = Q(topic__updated__lte=read_until)
+        if horizon is not None:
+            obsolete |= Q(time_stamp__lt=horizon)
+        obsolete_ids = list(marks.filter(obsolete).values_list('id', flat=True))
+        TopicReadTracker.objects.filter(id__in=obsolete_ids).delete()
+        return len(obsolete_ids)
+
+
+def has_more_updated_topics(forum, since, count):
+    """
+    Check if more than `count` topics of `forum` were updated after `since` (any time if None).
+    Reads at most `count` + 1 rows of (forum, updated) index, so when `count` is the number of topics
+    read by user after `since`, it tells if there are unread topics without scanning the whole forum.
+    """
+    topics = forum.topics.order_by()
+    if since is not None:
+        topics = topics.filter(updated__gt=since)
+    return len(topics.values_list('id', flat=True)[:count + 1]) > count
+
+
+def get_read_until(forum_id, read_since, read_topic_ids):
+    """
+    Return the latest time, not earlier than `read_since`, such that all topics of the forum updated
+    before it are read, when `read_topic_ids` are topics read after `read_since`.
+    """
+    unread = Topic.objects.filter(forum=forum_id, updated__isnull=False).exclude(id__in=read_topic_ids)
+    if read_since is not None:
+        unread = unread.filter(updated__gt=read_since)
+    first_unread = list(unread.order_by('updated').values_list('updated', flat=True)[:1])
+    if first_unread:
+        read_until = first_unread[0] - datetime.timedelta(microseconds=1)
+    else:
+        read_until = Topic.objects.filter(forum=forum_id).aggregate(Max('updated'))['updated__max']
+    if read_since is not None and (read_until is None or read_until < read_since):
+        read_until = read_since
+    return read_until
+
+
+def pack_marks(marks):
+    """
+    Pack {topic id: datetime} dict to a string of 16 bytes per topic
+    """
+    values = []
+    for topic_id, time_stamp in sorted(marks.items()):
+        if timezone.is_aware(time_stamp):
+            time_stamp = timezone.make_naive(time_stamp, timezone.utc)
+        delta = time_stamp - EPOCH
+        values.extend((topic_id, (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds))
+    return base64.b64encode(struct.pack('<%dq' % len(values), *values)).decode('ascii')
+
+
+def unpack_marks(packed):
+    """
+    Unpack string created by `pack_marks`
+    """
+    if not packed:
+        return {}
+    data = base64.b64decode(packed)
+    values = struct.unpack('<%dq' % (len(data) // 8), data)
+    marks = {}
+    for topic_id, microseconds in zip(values[::2], values[1::2]):
+        time_stamp = EPOCH + datetime.timedelta(microseconds=microseconds)
+        if settings.USE_TZ:
+            time_stamp = timezone.make_aware(time_stamp, timezone.utc)
+        marks[topic_id] = time_stamp
+    return marks
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class CompactReadTracking(BaseReadTracking):
+    """
+    Keeps one `ForumReadState` row per user and forum: time when the whole forum was read
+    and packed marks of topics read after that time.
+    """
+
+    def get_forum_marks(self, user, forums):
+        return dict(ForumReadState.objects.filter(user=user, forum__in=forums, time_stamp__isnull=False)
+                    .values_list('forum_id', 'time_stamp'))
+
+    def get_topic_marks(self, user, topics):
+        topics = list(topics)
+        marks = {}
+        states = ForumReadState.objects.filter(user=user, forum__in=set(topic.forum_id for topic in topics))
+        for packed in states.values_list('topics', flat=True):
+            marks.update(unpack_marks(packed))
+        topic_ids = set(topic.id for topic in topics)
+        return dict((topic_id, mark) for topic_id, mark in marks.items() if topic_id in topic_ids)
+
+    def mark_topic_read(self, user, topic, time_stamp=None):
+        self.mark_topics_read(user, {topic: time_stamp or timezone.now()})
+
+    def mark_topics_read(self, user, marks):
+        forum_topics = defaultdict(dict)
+        for topic, time_stamp in marks.items():
+            forum_topics[topic.forum][topic] = time_stamp
+        states = dict((forum_id, (time_stamp, packed)) for forum_id, time_stamp, packed in ForumReadState.objects
+                      .filter(user=user, forum__in=list(forum_topics.keys()))
+                      .values_list('forum_id', 'time_stamp', 'topics'))
+        rows = []
+        for forum, new_marks in forum_topics.items():
+            read_since, packed = states.get(forum.id, (None, ''))
+            new_marks = dict((topic.id, time_stamp) for topic, time_stamp in new_marks.items()
+                             if read_since is None or topic.updated > read_since)
+            if not new_marks:
+                continue
+            marks = unpack_marks(packed)
+            marks.update(new_marks)
+            # Check, if there are any unread topics in forum
+            read_topics = forum.topics.filter(id__in=list(marks.keys()))
+            if read_since is not None:
+                read_topics = read_topics.filter(updated__gt=read_since)
+            updated = dict(read_topics.values_list('id', 'updated'))
+            read_count = len([topic_id for topic_id in updated if marks[topic_id] >= updated[topic_id]])
+            if has_more_updated_topics(forum, read_since, read_count):
+                # marks of topics covered by forum read time or deleted aren't needed anymore
+                row = {'time_stamp': read_since, 'topics': pack_marks(dict((topic_id, marks[topic_id])
+                                                                           for topic_id in updated))}
+            else:
+                row = {'time_stamp': max(new_marks.values()), 'topics': ''}
+            row.update(user=user, forum=forum)
+            rows.append(row)
+        # states of all forums are written with single upsert statement
+        bulk_upsert(ForumReadState, rows, unique_fields=('user', 'forum'), update_fields=('time_stamp', 'topics'))
+
+    def mark_forums_read(self, user, forums, time_stamp=None):
+        ForumReadState.objects.update_or_create_states(user, list(forums), time_stamp or timezone.now())
+
+    def get_read_topic_ids(self, user, forums):
+        marks = {}
+        for packed in ForumReadState.objects.filter(user=user, forum__in=forums).values_list('topics', flat=True):
+            marks.update(unpack_marks(packed))
+        updated = Topic.objects.filter(id__in=list(marks.keys())).values_list('id', 'updated')
+        return [topic_id for topic_id, time_stamp in updated if time_stamp is not None and marks[topic_id] >= time_stamp]
+
+    def get_marked_forums(self):
+        return ForumReadState.objects.exclude(topics='').order_by('user', 'forum').values_list('user', 'forum')
+
+    def compact_forum_marks(self, user_id, forum_id, horizon=None):
+        try:
+            state = ForumReadState.objects.get(user=user_id, forum=forum_id)
+        except ForumReadState.DoesNotExist:
+            return 0
+        marks = unpack_marks(state.topics)
+        read_since = state.time_stamp
+        if horizon is not None and (read_since is None or read_since < horizon) and \
+                any(time_stamp < horizon for time_stamp in marks.values()):
+            read_since = horizon
+        updated = dict(Topic.objects.filter(id__in=list(marks.keys())).values_list('id', 'updated'))
+        read_until = get_read_until(forum_id, read_since, [topic_id for topic_id in updated
+                                                           if updated[topic_id] is not None and
+                                                           marks[topic_id] >= updated[topic_id]])
+        if read_until is None:
+            return 0
+        kept = dict((topic_id, marks[topic_id]) for topic_id in updated
+                    if updated[topic_id] is None or updated[topic_id] > read_until)
+        if horizon is not None:
+            kept = dict((topic_id, time_stamp) for topic_id, time_stamp in kept.items() if time_stamp >= horizon)
+        state.time_stamp, state.topics = read_until, pack_marks(kept)
+        state.save()
+        return len(marks) - len(kept)
+
+
+class BufferedReadTracking(BaseReadTracking):
+    """
+    Wraps another backend and keeps topic marks of each user in cache until there are
+    PYBB_READ_MARKS_BUFFER_SIZE of them or the oldest one is older than PYBB_READ_MARKS_FLUSH_INTERVAL
+    seconds, then writes them to the wrapped backend with their original read times.
+    Repeated views of the same topic don't write anything. Topic marks are read through the buffer,
+    forum marks are set by the wrapped backend when buffer is flushed. Buffers of users who don't
+    come back are written by `flush_all` (`pybb_flush_read_marks` management command).
+    Each flush starts a new buffer generation with atomic `cache.incr`, so marks added to a buffer
+    while it is flushed are not lost.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_generation(self, user):
+        cache_key = util.build_cache_key('read_marks_buffer_generation', user_id=user.pk)
+        generation = cache.get(cache_key)
+        if generation is None:
+            # counter could be evicted, new one starts after generations used before
+            cache.add(cache_key, int(time.time() * 1000000), None)
+            generation = cache.get(cache_key)
+        return generation
+
+    def get_buffer(self, user):
+        generation = self.get_generation(user)
+        buffer = cache.get(util.build_cache_key('read_marks_buffer', user_id=user.pk, generation=generation))
+        if buffer is not None and \
+                timezone.now() - buffer['since'] >= datetime.timedelta(seconds=defaults.PYBB_READ_MARKS_FLUSH_INTERVAL):
+            self.flush(user)
+            generation, buffer = self.get_generation(user), None
+        buffer = buffer or {'since': None, 'marks': {}}
+        buffer['generation'] = generation
+        return buffer
+
+    def set_buffer(self, user, buffer):
+        """ store buffer returned by `get_buffer` """
+        cache_key = util.build_cache_key('read_marks_buffer', user_id=user.pk, generation=buffer['generation'])
+        cache.set(cache_key, buffer, None)
+        if self.get_generation(user) != buffer['generation']:
+            # buffer was flushed meanwhile and flush could miss these marks, so they are written now
+            cache.delete(cache_key)
+            self.write_marks(user, buffer['marks'])
+
+    def get_buffered_user_ids(self):
+        """ return ids of users who may have buffered marks """
+        return cache.get(util.build_cache_key('read_marks_buffer_users')) or set()
+
+    def update_buffered_user_ids(self, added=(), removed=()):
+        cache_key = util.build_cache_key('read_marks_buffer_users')
+        cache.set(cache_key, (self.get_buffered_user_ids() | set(added)) - set(removed), None)
+
+    def flush(self, user, marks=None):
+        """
+        write buffered topic marks of `user` and not buffered `marks` to the wrapped backend with single batch
+        """
+        marks = dict(marks or {})
+        try:
+            # marks added after this point go to the buffer of the next generation
+            generation = cache.incr(util.build_cache_key('read_marks_buffer_generation', user_id=user.pk)) - 1
+        except ValueError:
+            # counter was evicted, so the buffer can't be found
+            generation = None
+        if generation is not None:
+            cache_key = util.build_cache_key('read_marks_buffer', user_id=user.pk, generation=generation)
+            buffer = cache.get(cache_key)
+            for topic_id, mark in (buffer['marks'] if buffer else {}).items():
+                if topic_id not in marks or marks[topic_id][1] < mark[1]:
+                    marks[topic_id] = mark
+        self.write_marks(user, marks)
+        if generation is not None:
+            cache.delete(cache_key)
+
+    def write_marks(self, user, marks):
+        if not marks:
+            return
+        topics = Topic.objects.filter(id__in=list(marks.keys())).select_related('forum')
+        self.backend.mark_topics_read(user, dict((topic, marks[topic.id][1]) for topic in topics))
+        # forum marks could be changed
+        touch_marks_version(user.pk)
+
+    def flush_all(self):
+        """ write buffered topic marks of all users, return number of users whose marks were written """
+        user_ids = self.get_buffered_user_ids()
+        # removed before flush, so users who start a new buffer meanwhile are registered again
+        self.update_buffered_user_ids(removed=user_ids)
+        users = list(get_user_model().objects.filter(pk__in=list(user_ids)))
+        for user in users:
+            self.flush(user)
+        return len(users)
+
+    def get_forum_marks(self, user, forums):
+        return self.backend.get_forum_marks(user, forums)
+
+    def get_topic_marks(self, user, topics):
+        topics = list(topics)
+        marks = self.backend.get_topic_marks(user, topics)
+        buffered = self.get_buffer(user)['marks']
+        for topic in topics:
+            if topic.id in buffered and (topic.id not in marks or marks[topic.id] < buffered[topic.id][1]):
+                marks[topic.id] = buffered[topic.id][1]
+        return marks
+
+    def mark_topic_read(self, user, topic, time_stamp=None):
+        buffer = self.get_buffer(user)
+        marks = buffer['marks']
+        if topic.id in marks and marks[topic.id][1] >= topic.updated:
+            # topic wasn't updated since the last view
+            return
+        time_stamp = time_stamp or timezone.now()
+        marks[topic.id] = (topic.forum_id, time_stamp)
+        new_buffer = buffer['since'] is None
+        buffer['since'] = buffer['since'] or time_stamp
+        if len(marks) >= defaults.PYBB_READ_MARKS_BUFFER_SIZE or \
+                time_stamp - buffer['since'] >= datetime.timedelta(seconds=defaults.PYBB_READ_MARKS_FLUSH_INTERVAL):
+            self.flush(user, marks)
+        else:
+            self.set_buffer(user, buffer)
+            if new_buffer:
+                self.update_buffered_user_ids(added=[user.pk])
+
+    def mark_forums_read(self, user, forums, time_stamp=None):
+        forums = list(forums)
+        forum_ids = set(getattr(forum, 'id', forum) for forum in forums)
+        buffer = self.get_buffer(user)
+        buffer['marks'] = dict((topic_id, mark) for topic_id, mark in buffer['marks'].items()
+                               if mark[0] not in forum_ids)
+        self.set_buffer(user, buffer)
+        self.backend.mark_forums_read(user, forums, time_stamp)
+
+    def get_first_unread_post(self, user, topic, posts):
+        if topic.id in self.get_buffer(user)['marks']:
+            return super(BufferedReadTracking, self).get_first_unread_post(user, topic, posts)
+        return self.backend.get_first_unread_post(user, topic, posts)
+
+    def get_read_topic_ids(self, user, forums):
+        topic_ids = set(self.backend.get_read_topic_ids(user, forums))
+        forum_ids = set(getattr(forum, 'id', forum) for forum in forums)
+        marks = dict((topic_id, mark[1]) for topic_id, mark in self.get_buffer(user)['marks'].items()
+                     if mark[0] in forum_ids)
+        for topic_id, updated in Topic.objects.filter(id__in=list(marks.keys())).values_list('id', 'updated'):
+            if updated is not None and marks[topic_id] >= updated:
+                topic_ids.add(topic_id)
+        return list(topic_ids)
+
+    def get_marked_forums(self):
+        return self.backend.get_marked_forums()
+
+    def compact_forum_marks(self, user_id, forum_id, horizon=None):
+        return self.backend.compact_forum_marks(user_id, forum_id, horizon)
+
+
+class UnreadResolver(object):
+    """
+    Request-scoped cache of user's read marks. Topics and forums shown on the page are registered
+    with `add` and marks for all of them are fetched with the first lookup, later lookups are
+    served from memory.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.topic_marks, self.forum_marks = {}, {}
+        self.pending_topics, self.pending_forums = {}, set()
+        self.topics = {}
+        self.forum_tree = None
+
+    def add(self, topics=(), forums=()):
+        for topic in topics:
+            self.topics[topic.id] = topic
+            if topic.id not in self.topic_marks:
+                self.pending_topics[topic.id] = topic
+            if topic.forum_id not in self.forum_marks:
+                self.pending_forums.add(topic.forum_id)
+        for forum in forums:
+            forum_id = getattr(forum, 'id', forum)
+            if forum_id not in self.forum_marks:
+                self.pending_forums.add(forum_id)
+
+    def fetch(self):
+        backend = get_read_tracking()
+        if self.pending_topics:
+            marks = backend.get_topic_marks(self.user, list(self.pending_topics.values()))
+            for topic_id in self.pending_topics:
+                self.topic_marks[topic_id] = marks.get(topic_id)
+            self.pending_topics = {}
+        if self.pending_forums:
+            marks = backend.get_forum_marks(self.user, list(self.pending_forums))
+            for forum_id in self.pending_forums:
+                self.forum_marks[forum_id] = marks.get(forum_id)
+            self.pending_forums = set()
+
+    def reset(self):
+        """ Forget fetched marks, registered topics and forums are fetched again with next lookup """
+        self.pending_topics = dict(self.topics)
+        self.pending_forums.update(self.forum_marks.keys())
+        self.topic_marks, self.forum_marks = {}, {}
+
+    def get_forum_marks(self, forums):
+        """ return {forum id: read time} for read `forums` """
+        self.add(forums=forums)
+        self.fetch()
+        forum_ids = [getattr(forum, 'id', forum) for forum in forums]
+        return dict((forum_id, self.forum_marks[forum_id]) for forum_id in forum_ids
+                    if self.forum_marks[forum_id] is not None)
+
+    def get_read_time(self, topic):
+        """ return time when user read `topic` or its forum, None if he didn't """
+        self.add(topics=[topic])
+        self.fetch()
+        marks = [mark for mark in (self.topic_marks[topic.id], self.forum_marks[topic.forum_id]) if mark is not None]
+        return max(marks) if marks else None
+
+    def get_forum_tree(self):
+        """
+        Return ({forum id: forum}, {forum id: [subforum ids]}) for all forums with counter shards applied
+        """
+        if self.forum_tree is None:
+            forum_dict = dict((forum.id, forum) for forum in ForumCounterShard.objects.apply(
+                Forum.objects.only('id', 'parent', 'post_count', 'topic_count', 'updated')))
+            children = defaultdict(list)
+            for forum in forum_dict.values():
+                if forum.parent_id is not None:
+                    children[forum.parent_id].append(forum.id)
+            self.add(forums=forum_dict.keys())
+            self.forum_tree = forum_dict, children
+        return self.forum_tree
+
+
+def attach_unread_resolver(user, topics=(), forums=()):
+    """
+    Bind resolver to `user` object of the current request and register `topics` and `forums`
+    shown on the page, so read marks for all of them are fetched at once
+    """
+    if not user.is_authenticated():
+        return None
+    resolver = getattr(user, '_pybb_unread_resolver', None)
+    if resolver is None:
+        resolver = UnreadResolver(user)
+        user._pybb_unread_resolver = resolver
+    resolver.add(topics, forums)
+    return resolver
+
+
+def get_unread_resolver(user):
+    """
+    Return resolver bound to `user` by `attach_unread_resolver` or a new not bound one
+    """
+    return getattr(user, '_pybb_unread_resolver', None) or UnreadResolver(user)
+
+
+def reset_unread_resolver(user):
+    """ Drop marks cached for `user`, they are changed """
+    resolver = getattr(user, '_pybb_unread_resolver', None)
+    if resolver is not None:
+        resolver.reset()
+
+
+def get_marks_version(user_id):
+    """
+    Value which changes whenever read marks of the user are changed. It's kept in cache,
+    so a new value is generated if it was evicted.
+    """
+    cache_key = util.build_cache_key('read_marks_version', user_id=user_id)
+    version = cache.get(cache_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(cache_key, version, None)
+    return version
+
+
+def touch_marks_version(user_id):
+    cache.delete(util.build_cache_key('read_marks_version', user_id=user_id))
+
+
+_backends = {}
+
+
+def get_read_tracking():
+    path = defaults.PYBB_READ_TRACKING_BACKEND
+    key = (path, bool(defaults.PYBB_READ_MARKS_BUFFER_SIZE))
+    if key not in _backends:
+        backend = util.resolve_class(path)
+        if defaults.PYBB_READ_MARKS_BUFFER_SIZE:
+            backend = BufferedReadTracking(backend)
+        _backends[key] = backend
+    return _backends[key]
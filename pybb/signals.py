@@ -2,13 +2,22 @@
 from __future__ import unicode_literals
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import post_save, post_delete, pre_save
-from pybb.models import Post, Category, Topic, Forum, create_or_check_slug
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import Signal
+from pybb.models import Post, Category, Topic, Forum, Attachment, PollAnswerUser, create_or_check_slug
 from pybb.subscription import notify_topic_subscribers
-from pybb import util, defaults, compat
+from pybb import util, defaults, compat, invalidation
 from pybb.permissions import perms
 
 
+# Sent when moderator changes topic flags (sticky, closed, on_moderation) with single UPDATE query,
+# post_save is not sent in this case. `changes` is a dict of changed field values.
+topic_moderated = Signal(providing_args=['topic', 'user', 'changes'])
+# Same for posts approved by moderator
+post_moderated = Signal(providing_args=['post', 'user', 'changes'])
+
+
 def post_saved(instance, **kwargs):
     if not defaults.PYBB_DISABLE_NOTIFICATIONS:
         notify_topic_subscribers(instance)
@@ -18,9 +27,7 @@ def post_saved(instance, **kwargs):
             instance.topic.subscribers.add(instance.user)
 
     if kwargs['created']:
-        profile = util.get_pybb_profile(instance.user)
-        profile.post_count = instance.user.posts.count()
-        profile.save()
+        util.get_pybb_profile(instance.user).adjust_post_count(1)
 
 
 def post_deleted(instance, **kwargs):
@@ -32,8 +39,66 @@ def post_deleted(instance, **kwargs):
         #When we cascade delete an user, profile and posts are also deleted
         pass
     else:
-        profile.post_count = instance.user.posts.count()
-        profile.save()
+        profile.adjust_post_count(-1)
+
+
+def object_saved(sender, instance, created, **kwargs):
+    # moved topic or post changes its old forum or topic too
+    if not created and sender == Topic and instance.field_changed('forum_id'):
+        invalidation.touch_forum(instance.get_loaded_value('forum_id'))
+    elif not created and sender == Post and instance.field_changed('topic_id'):
+        invalidation.touch_topic(instance.get_loaded_value('topic_id'))
+    invalidation.touch(instance)
+    if created and sender in (Topic, Post) and defaults.PYBB_FEED_CACHE_TIMEOUT:
+        invalidation.add_latest_id(instance)
+
+
+def object_deleted(sender, instance, **kwargs):
+    invalidation.touch(instance)
+    if sender in (Topic, Post):
+        invalidation.reset_latest_ids(sender)
+
+
+def object_moderated(sender, **kwargs):
+    invalidation.touch(kwargs['topic'] if sender == Topic else kwargs['post'])
+
+
+def attachment_changed(instance, **kwargs):
+    try:
+        invalidation.touch(instance.post)
+    except Post.DoesNotExist:
+        # deleted with the post
+        pass
+
+
+def poll_voted(instance, **kwargs):
+    try:
+        invalidation.touch_topic(instance.poll_answer.topic_id)
+    except ObjectDoesNotExist:
+        # deleted with the topic
+        pass
+
+
+def subscriptions_changed(instance, action, reverse, pk_set, **kwargs):
+    # pages show subscription state of the user
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        invalidation.touch(instance)
+    elif pk_set:
+        User = compat.get_user_model()
+        invalidation.touch(*[User(pk=pk) for pk in pk_set])
+
+
+def user_changed(sender, instance, **kwargs):
+    User = compat.get_user_model()
+    if sender == User and kwargs.get('update_fields') and set(kwargs['update_fields']) <= set(['last_login']):
+        # saved on every login, nothing shown on pages is changed
+        return
+    if sender == User:
+        invalidation.touch(instance)
+    else:
+        invalidation.touch(User(pk=instance.user_id))
 
 
 def user_saved(instance, created, **kwargs):
@@ -82,5 +147,43 @@ def setup():
     pre_save.connect(pre_save_topic_slug, sender=Topic)
     post_save.connect(post_saved, sender=Post)
     post_delete.connect(post_deleted, sender=Post)
+    if invalidation.is_enabled():
+        setup_invalidation()
     if defaults.PYBB_AUTO_USER_PERMISSIONS:
         post_save.connect(user_saved, sender=compat.get_user_model())
+
+
+def get_invalidation_handlers():
+    """
+    (signal, handler, sender) triples which change generations of cached objects, see `pybb.invalidation`
+    """
+    handlers = []
+    for model in (Category, Forum, Topic, Post):
+        handlers.extend([(post_save, object_saved, model), (post_delete, object_deleted, model)])
+    handlers.extend([
+        (topic_moderated, object_moderated, Topic),
+        (post_moderated, object_moderated, Post),
+        (post_save, attachment_changed, Attachment),
+        (post_delete, attachment_changed, Attachment),
+        (post_save, poll_voted, PollAnswerUser),
+        (post_delete, poll_voted, PollAnswerUser),
+        (m2m_changed, subscriptions_changed, Topic.subscribers.through),
+        (post_save, user_changed, compat.get_user_model()),
+    ])
+    if util.get_pybb_profile_model() != compat.get_user_model():
+        handlers.append((post_save, user_changed, util.get_pybb_profile_model()))
+    return handlers
+
+
+def setup_invalidation():
+    """
+    Connect invalidation handlers. Called by `setup` when any cache is enabled by settings,
+    handlers aren't run on every write otherwise.
+    """
+    for signal, handler, sender in get_invalidation_handlers():
+        signal.connect(handler, sender=sender, dispatch_uid='pybb_invalidation_%s' % handler.__name__)
+
+
+def teardown_invalidation():
+    for signal, handler, sender in get_invalidation_handlers():
+        signal.disconnect(handler, sender=sender, dispatch_uid='pybb_invalidation_%s' % handler.__name__)
@@ -11,7 +11,7 @@ from django.core.cache import cache
 from django.utils.safestring import mark_safe
 from django.utils.encoding import smart_text
 from django.utils.html import escape
-from django.utils.translation import ugettext as _
+from django.utils.translation import ugettext as _, get_language
 from django.utils import dateformat
 from django.utils.timezone import timedelta
 from django.utils.timezone import now as tznow
@@ -22,9 +22,10 @@ try:
 except ImportError:
     pytils_enabled = False
 
-from pybb.models import TopicReadTracker, ForumReadTracker, PollAnswerUser, Topic, Post
+from pybb.models import PollAnswerUser, Topic, Post
+from pybb.read_tracking import get_unread_resolver
 from pybb.permissions import perms
-from pybb import defaults, util, compat
+from pybb import defaults, util, compat, invalidation
 
 
 register = template.Library()
@@ -86,6 +87,46 @@ class PybbTimeNode(template.Node):
             return dateformat.format(context_time, 'd M, Y H:i')
 
 
+@register.tag
+def pybb_post_cache(parser, token):
+    """
+    Cache rendered part of post template which doesn't depend on current user:
+
+        {% pybb_post_cache post 'info' %} ... {% endpybb_post_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError('pybb_post_cache requires post and fragment name arguments')
+    nodelist = parser.parse(('endpybb_post_cache',))
+    parser.delete_first_token()
+    return PybbPostCacheNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
+
+
+class PybbPostCacheNode(template.Node):
+    def __init__(self, nodelist, post, name):
+        self.nodelist = nodelist
+        self.post = post
+        self.name = name
+
+    def render(self, context):
+        if not defaults.PYBB_POST_CACHE_TIMEOUT:
+            return self.nodelist.render(context)
+
+        post = self.post.resolve(context)
+        version = getattr(post, '_pybb_cache_version', None)
+        if version is None:
+            # post can have several cached parts, so versions are fetched once,
+            # TopicView fetches them for all posts of the page beforehand
+            version = post._pybb_cache_version = invalidation.get_version(post, post.user)
+        cache_key = util.build_cache_key('post_fragment', post_id=post.pk, name=self.name.resolve(context),
+                                         language=get_language(), version=version)
+        content = cache.get(cache_key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(cache_key, content, defaults.PYBB_POST_CACHE_TIMEOUT)
+        return content
+
+
 @register.simple_tag
 def pybb_link(object, anchor=''):
     """
@@ -133,16 +174,8 @@ def pybb_is_topic_unread(topic, user):
         return False
 
     last_topic_update = topic.updated or topic.created
-
-    unread = not ForumReadTracker.objects.filter(
-        forum=topic.forum,
-        user=user.id,
-        time_stamp__gte=last_topic_update).exists()
-    unread &= not TopicReadTracker.objects.filter(
-        topic=topic,
-        user=user.id,
-        time_stamp__gte=last_topic_update).exists()
-    return unread
+    read_time = get_unread_resolver(user).get_read_time(topic)
+    return read_time is None or read_time < last_topic_update
 
 
 @register.filter
@@ -153,25 +186,11 @@ def pybb_topic_unread(topics, user):
     topic_list = list(topics)
 
     if user.is_authenticated():
+        resolver = get_unread_resolver(user)
+        resolver.add(topics=topic_list)
         for topic in topic_list:
-            topic.unread = True
-
-        forums_ids = [f.forum_id for f in topic_list]
-        forum_marks = dict([(m.forum_id, m.time_stamp)
-                            for m
-                            in ForumReadTracker.objects.filter(user=user, forum__in=forums_ids)])
-        if len(forum_marks):
-            for topic in topic_list:
-                topic_updated = topic.updated or topic.created
-                if topic.forum.id in forum_marks and topic_updated <= forum_marks[topic.forum.id]:
-                    topic.unread = False
-
-        qs = TopicReadTracker.objects.filter(user=user, topic__in=topic_list).select_related('topic')
-        topic_marks = list(qs)
-        topic_dict = dict(((topic.id, topic) for topic in topic_list))
-        for mark in topic_marks:
-            if topic_dict[mark.topic.id].updated <= mark.time_stamp:
-                topic_dict[mark.topic.id].unread = False
+            read_time = resolver.get_read_time(topic)
+            topic.unread = read_time is None or read_time < (topic.updated or topic.created)
     return topic_list
 
 
@@ -179,21 +198,39 @@ def pybb_topic_unread(topics, user):
 def pybb_forum_unread(forums, user):
     """
     Check if forum has unread messages.
+    Forum with read mark is unread if any of its subforums on any level is unread.
+    Forum tree and read marks are loaded with fixed number of queries and processed in memory.
     """
     forum_list = list(forums)
     if user.is_authenticated():
+        resolver = get_unread_resolver(user)
+        forum_dict, children = resolver.get_forum_tree()
+        forum_dict = dict(forum_dict)
+        forum_dict.update((forum.id, forum) for forum in forum_list)
+        forum_marks = resolver.get_forum_marks(list(forum_dict.keys()))
+
+        unread = {}
         for forum in forum_list:
-            forum.unread = forum.topic_count > 0
-        forum_marks = ForumReadTracker.objects.filter(
-            user=user,
-            forum__in=forum_list
-        ).select_related('forum')
-        forum_dict = dict(((forum.id, forum) for forum in forum_list))
-        for mark in forum_marks:
-            curr_forum = forum_dict[mark.forum.id]
-            if (curr_forum.updated is None) or (curr_forum.updated <= mark.time_stamp):
-                if not any((f.unread for f in pybb_forum_unread(curr_forum.child_forums.all(), user))):
-                    forum_dict[mark.forum.id].unread = False
+            # post-order traversal, so subforums are resolved before their parent
+            stack, seen = [(forum.id, False)], set()
+            while stack:
+                forum_id, resolve = stack.pop()
+                if forum_id in unread:
+                    continue
+                if not resolve:
+                    if forum_id in seen:
+                        continue
+                    seen.add(forum_id)
+                    stack.append((forum_id, True))
+                    stack.extend((child_id, False) for child_id in children[forum_id])
+                    continue
+                curr_forum = forum_dict[forum_id]
+                time_stamp = forum_marks.get(forum_id)
+                if time_stamp is not None and (curr_forum.updated is None or curr_forum.updated <= time_stamp):
+                    unread[forum_id] = any(unread.get(child_id, False) for child_id in children[forum_id])
+                else:
+                    unread[forum_id] = curr_forum.topic_count > 0
+            forum.unread = unread[forum.id]
     return forum_list
 
 
@@ -2,24 +2,29 @@
 
 from __future__ import unicode_literals
 import datetime
+import hashlib
 import os
+from importlib import import_module
 from django.contrib.auth.models import Permission
 from django.conf import settings
 from django.core import mail
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db.models import F, Q
 from django.http import HttpResponseRedirect, HttpResponsePermanentRedirect
 from django.test import TestCase, skipUnlessDBFeature
 from django.test.client import Client
 from django.test.utils import override_settings
 from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import get_language
 from pybb import permissions, views as pybb_views
+from pybb.views import UnreadTopicsView, UnreadTopicsJsonView
 from pybb.templatetags.pybb_tags import pybb_is_topic_unread, pybb_topic_unread, pybb_forum_unread, \
     pybb_get_latest_topics, pybb_get_latest_posts
 
-from pybb import compat, util
+from pybb import compat, util, invalidation, signals
 
 User = compat.get_user_model()
 username_field = compat.get_username_field()
@@ -30,7 +35,10 @@ except ImportError:
     raise Exception('PyBB requires lxml for self testing')
 
 from pybb import defaults
-from pybb.models import Topic, TopicReadTracker, Forum, ForumReadTracker, Post, Category, PollAnswer
+from pybb.pagination import PositionPaginator
+from pybb.read_tracking import attach_unread_resolver, get_read_tracking, BufferedReadTracking, RowReadTracking
+from pybb.models import Topic, TopicReadTracker, Forum, ForumReadTracker, Post, Category, PollAnswer, \
+    ForumCounterShard, ForumReadState
 
 
 Profile = util.get_pybb_profile_model()
@@ -127,6 +135,8 @@ class FeaturesTest(TestCase, SharedTestModule):
         for i in range(0, defaults.PYBB_FORUM_PAGE_SIZE + 3):
             topic = Topic(name='topic_%s_' % i, forum=self.forum, user=self.user)
             topic.save()
+            # topics without posts are not listed, see test_forum_hides_empty_topics
+            Post.objects.create(topic=topic, user=self.user, body='bbcode [b]test[/b]')
         url = self.forum.get_absolute_url()
         response = self.client.get(url)
         self.assertEqual(len(response.context['topic_list']), defaults.PYBB_FORUM_PAGE_SIZE)
@@ -521,6 +531,455 @@ class FeaturesTest(TestCase, SharedTestModule):
         self.assertListEqual([f.unread for f in pybb_forum_unread([forum_parent, forum_child1, forum_child2], user_ann)],
                              [False, False, False])
 
+    def test_forum_unread_filter_nested_queries(self):
+        forums = [self.forum]
+        for i in range(4):
+            forums.append(Forum.objects.create(name='sub%d' % i, category=self.category, parent=forums[-1]))
+        topic = Topic.objects.create(name='deep', forum=forums[-1], user=self.user)
+        Post.objects.create(topic=topic, user=self.user, body='deep')
+        ForumReadTracker.objects.mark_read(self.user, forums)
+        forums = list(Forum.objects.filter(id__in=[f.id for f in forums]).order_by('id'))
+        with self.assertNumQueries(2):
+            self.assertEqual([f.unread for f in pybb_forum_unread(forums, self.user)], [False] * 5)
+
+        Post.objects.create(topic=topic, user=self.user, body='new')
+        forums = list(Forum.objects.filter(id__in=[f.id for f in forums]).order_by('id'))
+        with self.assertNumQueries(2):
+            self.assertEqual([f.unread for f in pybb_forum_unread(forums[:1], self.user)], [True])
+        self.assertEqual([f.unread for f in pybb_forum_unread(forums, self.user)], [True] * 5)
+
+    def test_unread_resolver_batches_marks(self):
+        topics = [self.topic] + [Topic.objects.create(name='topic%d' % i, forum=self.forum, user=self.user)
+                                 for i in range(5)]
+        for topic in topics[1:]:
+            Post.objects.create(topic=topic, user=self.user, body='one')
+        topics = list(Topic.objects.filter(id__in=[t.id for t in topics]).order_by('id'))
+        TopicReadTracker.objects.mark_read(self.user, topics[0])
+
+        attach_unread_resolver(self.user, topics=topics)
+        # one query for topic marks and one for forum marks
+        with self.assertNumQueries(2):
+            self.assertEqual([pybb_is_topic_unread(t, self.user) for t in topics], [False] + [True] * 5)
+            self.assertEqual([t.unread for t in pybb_topic_unread(topics, self.user)], [False] + [True] * 5)
+
+        # marking resets cached marks
+        TopicReadTracker.objects.mark_read(self.user, topics[1])
+        self.assertEqual([pybb_is_topic_unread(t, self.user) for t in topics], [False, False] + [True] * 4)
+
+    def test_read_trackers_upsert(self):
+        forums = [self.forum] + [Forum.objects.create(name='forum%d' % i, category=self.category) for i in range(5)]
+        old = timezone.now() - datetime.timedelta(days=1)
+        ForumReadTracker.objects.create(user=self.user, forum=self.forum)
+        ForumReadTracker.objects.filter(user=self.user).update(time_stamp=old)
+        with self.assertNumQueries(1):
+            ForumReadTracker.objects.update_or_create_trackers(self.user, forums)
+        self.assertEqual(ForumReadTracker.objects.filter(user=self.user).count(), 6)
+        self.assertGreater(ForumReadTracker.objects.get(user=self.user, forum=self.forum).time_stamp, old)
+
+        with self.assertNumQueries(1):
+            TopicReadTracker.objects.update_or_create_trackers(self.user, [self.topic])
+        self.assertTrue(TopicReadTracker.objects.filter(user=self.user, topic=self.topic).exists())
+
+        # fallback for databases without upsert statement keeps given time of new rows
+        from django.db import connection
+        TopicReadTracker.objects.all().delete()
+        vendor = connection.vendor
+        connection.vendor = 'unknown'
+        try:
+            TopicReadTracker.objects.update_or_create_trackers(self.user, [self.topic], old)
+            ForumReadTracker.objects.update_or_create_trackers(self.user, forums[:2], old)
+        finally:
+            connection.vendor = vendor
+        self.assertEqual(TopicReadTracker.objects.get(user=self.user, topic=self.topic).time_stamp, old)
+        self.assertEqual(ForumReadTracker.objects.get(user=self.user, forum=forums[1]).time_stamp, old)
+
+    @skipUnlessDBFeature('supports_microsecond_precision')
+    def test_compact_read_trackers_command(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+
+        topic_2 = Topic.objects.create(name='topic_2', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_2, user=self.user, body='one')
+        topic_3 = Topic.objects.create(name='topic_3', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_3, user=self.user, body='one')
+        for backend in ('pybb.read_tracking.RowReadTracking', 'pybb.read_tracking.CompactReadTracking'):
+            defaults.PYBB_READ_TRACKING_BACKEND = backend
+            try:
+                topics = list(Topic.objects.filter(forum=self.forum).order_by('id'))
+                TopicReadTracker.objects.mark_read(self.user, topics[0])
+                TopicReadTracker.objects.mark_read(self.user, topics[1])
+                self.assertEqual(len(TopicReadTracker.objects.get_marks(self.user, topics)), 2)
+
+                call_command('pybb_compact_read_trackers', stdout=StringIO())
+                self.assertFalse(TopicReadTracker.objects.get_marks(self.user, topics))
+                self.assertEqual([t.unread for t in pybb_topic_unread(topics, self.user)], [False, False, True])
+            finally:
+                defaults.PYBB_READ_TRACKING_BACKEND = 'pybb.read_tracking.RowReadTracking'
+
+        # stale mark older than horizon is dropped, topic updated after horizon stays unread
+        mark = TopicReadTracker.objects.create(user=self.user, topic=topic_3)
+        TopicReadTracker.objects.filter(id=mark.id).update(time_stamp=timezone.now() - datetime.timedelta(days=60))
+        out = StringIO()
+        call_command('pybb_compact_read_trackers', days=30, stdout=out)
+        self.assertIn('1 topic marks dropped', out.getvalue())
+        self.assertFalse(TopicReadTracker.objects.exists())
+        self.assertTrue(pybb_is_topic_unread(Topic.objects.get(id=topic_3.id), self.user))
+
+    def test_unread_topics_view(self):
+        import json
+
+        topics = [self.topic]
+        for i in range(3):
+            topic = Topic.objects.create(name='topic%d' % i, forum=self.forum, user=self.user)
+            Post.objects.create(topic=topic, user=self.user, body='one')
+            topics.append(topic)
+        forum_2 = Forum.objects.create(name='forum_2', category=self.category)
+        topic = Topic.objects.create(name='other', forum=forum_2, user=self.user)
+        Post.objects.create(topic=topic, user=self.user, body='one')
+        topics.append(topic)
+        topics = list(Topic.objects.filter(id__in=[t.id for t in topics]).order_by('id'))
+        ForumReadTracker.objects.mark_read(self.user, [forum_2])
+        TopicReadTracker.objects.mark_read(self.user, topics[1])
+        Post.objects.create(topic=topics[-1], user=self.user, body='two')
+
+        self.login_client()
+        url = reverse('pybb:topic_unread')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        expected = [topics[-1], topics[3], topics[2], topics[0]]
+        self.assertEqual(list(response.context['topic_list']), expected)
+
+        defaults_page_size = UnreadTopicsView.paginate_by
+        UnreadTopicsView.paginate_by = UnreadTopicsJsonView.paginate_by = 3
+        try:
+            data = json.loads(self.client.get(reverse('pybb:topic_unread_json')).content.decode('utf-8'))
+            self.assertEqual([t['id'] for t in data['topics']], [t.id for t in expected[:3]])
+            data = json.loads(self.client.get(reverse('pybb:topic_unread_json'),
+                                              data={'after': data['next']}).content.decode('utf-8'))
+            self.assertEqual([t['id'] for t in data['topics']], [expected[3].id])
+            self.assertEqual(data['next'], None)
+            data = json.loads(self.client.get(reverse('pybb:topic_unread_json'),
+                                              data={'before': data['previous']}).content.decode('utf-8'))
+            self.assertEqual([t['id'] for t in data['topics']], [t.id for t in expected[:3]])
+            self.assertEqual(data['previous'], None)
+        finally:
+            UnreadTopicsView.paginate_by = UnreadTopicsJsonView.paginate_by = defaults_page_size
+
+        # queries don't change with number of read marks
+        import re
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def get_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(list(self.client.get(url).context['topic_list']), expected[:2])
+            return [re.sub(r'\d+', '0', query['sql']) for query in context.captured_queries]
+
+        for topic in expected:
+            Topic.objects.filter(id=topic.id).update(updated=F('updated') + datetime.timedelta(days=1))
+        UnreadTopicsView.paginate_by = 2
+        try:
+            queries = get_queries()
+            for i in range(5):
+                topic = Topic.objects.create(name='read%d' % i, forum=self.forum, user=self.user)
+                Post.objects.create(topic=topic, user=self.user, body='one')
+                TopicReadTracker.objects.mark_read(self.user, topic)
+            self.assertEqual(get_queries(), queries)
+        finally:
+            UnreadTopicsView.paginate_by = defaults_page_size
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_forum_unread_json(self):
+        import json
+
+        forum_2 = Forum.objects.create(name='forum_2', category=self.category)
+        subforum = Forum.objects.create(name='subforum', category=self.category, parent=forum_2)
+        for forum in (self.forum, subforum, subforum):
+            topic = Topic.objects.create(name='topic', forum=forum, user=self.user)
+            Post.objects.create(topic=topic, user=self.user, body='one')
+        ForumReadTracker.objects.mark_read(self.user, [forum_2])
+
+        self.login_client()
+        url = reverse('pybb:forum_unread_json')
+        params = {'forums': '%s,%s' % (self.forum.id, forum_2.id)}
+        response = self.client.get(url, data=params)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['forums'], {
+            str(self.forum.id): {'unread': True, 'unread_topics': 2},
+            str(forum_2.id): {'unread': True, 'unread_topics': 0},
+        })
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, data=params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        ForumReadTracker.objects.mark_read(self.user, [subforum])
+        response = self.client.get(url, data=params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertFalse(data['forums'][str(forum_2.id)]['unread'])
+        self.assertEqual(self.client.get(url, data={'forums': 'x'}).status_code, 400)
+
+    def test_buffered_read_marks(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+
+        topic_2 = Topic.objects.create(name='topic_2', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_2, user=self.user, body='one')
+        topic_3 = Topic.objects.create(name='topic_3', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_3, user=self.user, body='one')
+        topics = list(Topic.objects.filter(forum=self.forum).order_by('id'))
+        defaults.PYBB_READ_MARKS_BUFFER_SIZE = 3
+        try:
+            self.login_client()
+            self.client.get(topics[0].get_absolute_url())
+            self.client.get(topics[0].get_absolute_url())
+            self.client.get(topics[1].get_absolute_url())
+            # marks are kept in cache, but unread filters see them
+            self.assertFalse(TopicReadTracker.objects.exists())
+            self.assertEqual([t.unread for t in pybb_topic_unread(topics, self.user)], [False, False, True])
+            self.assertFalse(pybb_is_topic_unread(topics[1], self.user))
+
+            # buffer is full
+            self.client.get(topics[2].get_absolute_url())
+            self.assertTrue(ForumReadTracker.objects.filter(user=self.user, forum=self.forum).exists())
+            self.assertFalse(pybb_forum_unread([Forum.objects.get(id=self.forum.id)], self.user)[0].unread)
+
+            # flushed by age
+            ForumReadTracker.objects.all().delete()
+            defaults.PYBB_READ_MARKS_FLUSH_INTERVAL = 0
+            self.client.get(topics[0].get_absolute_url())
+            self.assertTrue(TopicReadTracker.objects.filter(user=self.user, topic=topics[0]).exists())
+
+            # buffers of users who don't come back are flushed by management command
+            defaults.PYBB_READ_MARKS_FLUSH_INTERVAL = 60
+            TopicReadTracker.objects.all().delete()
+            Post.objects.create(topic=topics[1], user=self.user, body='two')
+            self.client.get(topics[1].get_absolute_url())
+            self.assertFalse(TopicReadTracker.objects.exists())
+            call_command('pybb_flush_read_marks', stdout=StringIO())
+            self.assertTrue(TopicReadTracker.objects.filter(user=self.user, topic=topics[1]).exists())
+        finally:
+            defaults.PYBB_READ_MARKS_BUFFER_SIZE = 0
+            defaults.PYBB_READ_MARKS_FLUSH_INTERVAL = 60
+            cache.clear()
+
+    def test_buffered_read_marks_flush_race(self):
+        topic_2 = Topic.objects.create(name='topic_2', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_2, user=self.user, body='one')
+        topic_2 = Topic.objects.get(id=topic_2.id)
+        # unread topic left, so topic marks are not replaced with forum mark
+        Post.objects.create(topic=Topic.objects.create(name='topic_3', forum=self.forum, user=self.user),
+                            user=self.user, body='one')
+        tracking = BufferedReadTracking(RowReadTracking())
+        mark_topics_read = tracking.backend.mark_topics_read
+        try:
+            defaults.PYBB_READ_MARKS_BUFFER_SIZE = 10
+            tracking.mark_topic_read(self.user, self.topic)
+            # another request has read the buffer before the flush started
+            buffer = tracking.get_buffer(self.user)
+
+            def mark_during_flush(user, topics):
+                # and stores its mark after the flush has read the buffer
+                tracking.backend.mark_topics_read = mark_topics_read
+                tracking.get_buffer = lambda user: buffer
+                tracking.mark_topic_read(user, topic_2)
+                del tracking.get_buffer
+                mark_topics_read(user, topics)
+
+            tracking.backend.mark_topics_read = mark_during_flush
+            tracking.flush(self.user)
+            self.assertEqual(set(TopicReadTracker.objects.filter(user=self.user).values_list('topic_id', flat=True)),
+                             set([self.topic.id, topic_2.id]))
+            self.assertEqual(tracking.get_buffer(self.user)['marks'], {})
+        finally:
+            tracking.backend.mark_topics_read = mark_topics_read
+            defaults.PYBB_READ_MARKS_BUFFER_SIZE = 0
+            cache.clear()
+
+    def test_cache_generations(self):
+        defaults.PYBB_POST_CACHE_TIMEOUT = 60
+        signals.setup_invalidation()
+        try:
+            forum_2 = Forum.objects.create(name='f2', category=self.category)
+            objects = [self.post, self.topic, self.forum, forum_2, self.category]
+            generations = invalidation.get_generations(*objects)
+            self.assertEqual(invalidation.get_generations(*objects), generations)
+
+            self.post.body = 'changed'
+            self.post.save()
+            changed = invalidation.get_generations(*objects)
+            self.assertEqual([old != new for old, new in zip(generations, changed)], [True, True, True, False, True])
+
+            # moved topic changes both forums
+            generations = changed
+            self.topic.forum = forum_2
+            self.topic.save()
+            changed = invalidation.get_generations(*objects)
+            self.assertEqual([old != new for old, new in zip(generations, changed)], [False, True, True, True, True])
+
+            # login only updates last_login, pages of the user are not changed
+            generation = invalidation.get_generations(self.user)
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+            self.assertEqual(invalidation.get_generations(self.user), generation)
+            self.user.save()
+            self.assertNotEqual(invalidation.get_generations(self.user), generation)
+        finally:
+            defaults.PYBB_POST_CACHE_TIMEOUT = 0
+            signals.teardown_invalidation()
+
+        # generations are not maintained without caches
+        generations = invalidation.get_generations(self.post, self.topic)
+        self.post.body = 'changed again'
+        self.post.save()
+        self.assertEqual(invalidation.get_generations(self.post, self.topic), generations)
+
+    def test_anonymous_page_cache(self):
+        defaults.PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT = 60
+        signals.setup_invalidation()
+        url = self.topic.get_absolute_url()
+        try:
+            self.assertContains(self.client.get(url), self.post.body_html)
+            Post.objects.filter(pk=self.post.pk).update(body_html='<p>changed</p>')
+            self.assertNotContains(self.client.get(url), 'changed')
+            # users get fresh page
+            self.login_client()
+            self.assertContains(self.client.get(url), 'changed')
+            self.client.logout()
+            # page is invalidated by post change
+            self.post.body = 'edited'
+            self.post.save()
+            self.assertContains(self.client.get(url), 'edited')
+            # stale page is served while page is rendered by another request
+            self.post.body = 'edited again'
+            self.post.save()
+            cache_key = util.build_cache_key('anonymous_page', path_hash=hashlib.md5(url.encode('utf-8')).hexdigest(),
+                                             language=get_language())
+            cache.set('%s_lock' % cache_key, True)
+            self.assertNotContains(self.client.get(url), 'edited again')
+            cache.delete('%s_lock' % cache_key)
+            self.assertContains(self.client.get(url), 'edited again')
+        finally:
+            defaults.PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT = 0
+            signals.teardown_invalidation()
+            cache.clear()
+
+    def test_conditional_get(self):
+        defaults.PYBB_POST_CACHE_TIMEOUT = 60
+        signals.setup_invalidation()
+        try:
+            url = self.topic.get_absolute_url()
+            response = self.client.get(url)
+            self.assertFalse(response.has_header('Last-Modified'))
+            etag = response['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # page changes without changing time of the last post, only ETag is a validator
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+            self.assertEqual(self.client.get(reverse('pybb:feed_posts'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+            # new post changes the page
+            Post.objects.create(topic=self.topic, user=self.user, body='two')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+            # authenticated user gets own validator, which changes with read marks
+            self.login_client()
+            self.assertNotEqual(self.client.get(url)['ETag'], response['ETag'])
+            forum_url = self.forum.get_absolute_url()
+            response = self.client.get(forum_url)
+            self.assertFalse(response.has_header('Last-Modified'))
+            self.assertEqual(self.client.get(forum_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            TopicReadTracker.objects.mark_read(self.user, self.topic)
+            self.assertEqual(self.client.get(forum_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        finally:
+            defaults.PYBB_POST_CACHE_TIMEOUT = 0
+            signals.teardown_invalidation()
+
+    def test_feed_cache(self):
+        defaults.PYBB_FEED_CACHE_TIMEOUT = 60
+        signals.setup_invalidation()
+        cache.clear()
+        try:
+            self.assertContains(self.client.get(reverse('pybb:feed_posts')), 'bbcode')
+            self.assertEqual(cache.get(util.build_cache_key('latest_ids', model='post')), [self.post.id])
+            # feed is cached until next change
+            Post.objects.filter(pk=self.post.pk).update(body_html='<p>changed</p>')
+            self.assertNotContains(self.client.get(reverse('pybb:feed_posts')), 'changed')
+
+            # latest ids are updated incrementally
+            hidden_forum = Forum.objects.create(name='hidden', category=self.category, hidden=True)
+            hidden_topic = Topic.objects.create(name='hidden', forum=hidden_forum, user=self.user)
+            post = Post.objects.create(topic=hidden_topic, user=self.user, body='hidden post')
+            self.assertEqual(cache.get(util.build_cache_key('latest_ids', model='post')), [post.id, self.post.id])
+            response = self.client.get(reverse('pybb:feed_posts'))
+            self.assertContains(response, 'changed')
+            self.assertNotContains(response, 'hidden post')
+            # feeds are cached for each permission group
+            self.user.is_staff = True
+            self.user.save()
+            self.login_client()
+            self.assertContains(self.client.get(reverse('pybb:feed_posts')), 'hidden post')
+            self.assertContains(self.client.get(reverse('pybb:feed_topics')), 'hidden')
+
+            # author's own topic on moderation is not shared with other users
+            self.assertIsNone(permissions.perms.get_cache_group(self.user))
+            Topic.objects.filter(pk=hidden_topic.pk).update(on_moderation=True, forum=self.forum)
+            invalidation.touch(self.category)
+            self.assertContains(self.client.get(reverse('pybb:feed_topics')), 'hidden')
+            self.client.logout()
+            self.assertNotContains(self.client.get(reverse('pybb:feed_topics')), 'hidden')
+        finally:
+            defaults.PYBB_FEED_CACHE_TIMEOUT = 0
+            signals.teardown_invalidation()
+            cache.clear()
+
+    def test_post_cache(self):
+        defaults.PYBB_POST_CACHE_TIMEOUT = 60
+        signals.setup_invalidation()
+        try:
+            response = self.client.get(self.topic.get_absolute_url())
+            self.assertContains(response, '<span class="post-username">zeus</span>')
+            User.objects.filter(pk=self.user.pk).update(username='hera')
+            response = self.client.get(self.topic.get_absolute_url())
+            self.assertContains(response, '<span class="post-username">zeus</span>')
+            # saving author invalidates cached parts
+            User.objects.get(pk=self.user.pk).save()
+            response = self.client.get(self.topic.get_absolute_url())
+            self.assertContains(response, '<span class="post-username">hera</span>')
+
+            # signature is cached too and refreshed when profile is saved
+            profile = util.get_pybb_profile(User.objects.get(pk=self.user.pk))
+            util.get_pybb_profile_model().objects.filter(pk=profile.pk).update(signature='sign', signature_html='sign 1')
+            self.assertNotContains(self.client.get(self.topic.get_absolute_url()), 'sign 1')
+            profile.signature = 'sign 2'
+            profile.save()
+            self.assertContains(self.client.get(self.topic.get_absolute_url()), 'sign 2')
+
+            # versions of all posts on the page are fetched at once
+            calls = []
+            get_generations = invalidation.get_generations
+
+            def counting_get_generations(*objects):
+                calls.append(objects)
+                return get_generations(*objects)
+
+            invalidation.get_generations = counting_get_generations
+            try:
+                self.client.get(self.topic.get_absolute_url())
+                calls_count = len(calls)
+                for i in range(3):
+                    Post.objects.create(topic=self.topic, user=self.user, body='post %s' % i)
+                del calls[:]
+                self.client.get(self.topic.get_absolute_url())
+                self.assertEqual(len(calls), calls_count)
+            finally:
+                invalidation.get_generations = get_generations
+        finally:
+            defaults.PYBB_POST_CACHE_TIMEOUT = 0
+            signals.teardown_invalidation()
+            cache.clear()
+
     @skipUnlessDBFeature('supports_microsecond_precision')
     def test_read_tracker_when_topics_forum_changed(self):
         forum_1 = Forum.objects.create(name='f1', description='bar', category=self.category)
@@ -604,6 +1063,24 @@ class FeaturesTest(TestCase, SharedTestModule):
         response = client_ann.get(topic_1.get_absolute_url(), data={'first-unread': 1}, follow=True)
         self.assertRedirects(response, '%s?page=%d#post-%d' % (topic_1.get_absolute_url(), 1, post_1_3.id))
 
+    def test_first_unread_redirects_to_topic_page(self):
+        for i in range(defaults.PYBB_TOPIC_PAGE_SIZE):
+            Post.objects.create(topic=self.topic, user=self.user, body='post %d' % i)
+        self.login_client()
+        self.client.get(self.topic.get_absolute_url())
+        new_post = Post.objects.create(topic=self.topic, user=self.user, body='new')
+        for backend in ('pybb.read_tracking.RowReadTracking', 'pybb.read_tracking.CompactReadTracking'):
+            defaults.PYBB_READ_TRACKING_BACKEND = backend
+            try:
+                TopicReadTracker.objects.mark_read(self.user, Topic.objects.get(id=self.topic.id))
+                Post.objects.filter(id=new_post.id).update(created=timezone.now() + datetime.timedelta(seconds=1))
+                response = self.client.get(self.topic.get_absolute_url(), data={'first-unread': 1})
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response['Location'].endswith(
+                    '%s?page=2#post-%d' % (self.topic.get_absolute_url(), new_post.id)))
+            finally:
+                defaults.PYBB_READ_TRACKING_BACKEND = 'pybb.read_tracking.RowReadTracking'
+
     def test_latest_topics(self):
         topic_1 = self.topic
         topic_1.updated = timezone.now()
@@ -785,6 +1262,27 @@ class FeaturesTest(TestCase, SharedTestModule):
         self.assertEqual(Topic.objects.count(), 1)
         self.assertEqual(Post.objects.filter(user=user).count(), 0)
 
+    def test_user_blocking_keeps_positions(self):
+        user = User.objects.create_user('test', 'test@localhost', 'test')
+        Post.objects.create(topic=self.topic, user=user, body='middle')
+        last = Post.objects.create(topic=self.topic, user=self.user, body='last')
+        topic = Topic.objects.create(name='topic', forum=self.forum, user=user)
+        Post.objects.create(topic=topic, user=user, body='head')
+        self.assertEqual(Forum.objects.get(id=self.forum.id).topic_count, 2)
+        self.user.is_superuser = True
+        self.user.save()
+        self.login_client()
+        self.client.post(reverse('pybb:block_user', args=[user.username]),
+                         data={'block_and_delete_messages': 'block_and_delete_messages'})
+        self.assertEqual(list(self.topic.posts.order_by('created', 'id').values_list('position', flat=True)),
+                         [1, 2])
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual((topic.post_count, topic.last_post_id), (2, last.id))
+        forum = Forum.objects.get(id=self.forum.id)
+        self.assertEqual((forum.topic_count, forum.post_count, forum.last_post_id), (1, 2, last.id))
+        response = self.client.get(last.get_absolute_url(), follow=True)
+        self.assertContains(response, 'last')
+
     def test_user_unblocking(self):
         user = User.objects.create_user('test', 'test@localhost', 'test')
         user.is_active=False
@@ -865,6 +1363,35 @@ class FeaturesTest(TestCase, SharedTestModule):
         self.assertEqual(
             self.client.get(reverse('pybb:unstick_topic', kwargs={'pk': self.topic.id}), follow=True).status_code, 200)
 
+    def test_moderation_signals(self):
+        from django.db.models.signals import post_save
+        from pybb.signals import topic_moderated
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.login_client()
+        received, saved = [], []
+
+        def on_moderated(topic, user, changes, **kwargs):
+            received.append((topic.id, user, changes))
+
+        def on_saved(instance, **kwargs):
+            saved.append(instance)
+
+        topic_moderated.connect(on_moderated)
+        post_save.connect(on_saved, sender=Topic)
+        try:
+            self.client.get(reverse('pybb:stick_topic', kwargs={'pk': self.topic.id}))
+            self.client.get(reverse('pybb:close_topic', kwargs={'pk': self.topic.id}))
+        finally:
+            topic_moderated.disconnect(on_moderated)
+            post_save.disconnect(on_saved, sender=Topic)
+        self.assertEqual(received, [(self.topic.id, self.user, {'sticky': True}),
+                                    (self.topic.id, self.user, {'closed': True})])
+        self.assertEqual(saved, [])
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertTrue(topic.sticky and topic.closed)
+
     def test_delete_view(self):
         post = Post(topic=self.topic, user=self.user, body='test to delete')
         post.save()
@@ -1051,6 +1578,332 @@ class FeaturesTest(TestCase, SharedTestModule):
         self.assertEqual(forum_1.topic_count, 0)
         self.assertEqual(forum_1.post_count, 0)
 
+    def test_counters_on_post_move(self):
+        forum_2 = Forum.objects.create(name='new forum', category=self.category)
+        topic_2 = Topic.objects.create(name='new topic', forum=forum_2, user=self.user)
+        Post.objects.create(topic=topic_2, user=self.user, body='head')
+        post = Post.objects.create(topic=self.topic, user=self.user, body='moved')
+
+        post = Post.objects.get(id=post.id)
+        post.topic = topic_2
+        post.save()
+
+        def counters():
+            return (list(Topic.objects.order_by('id').values_list('post_count', 'updated')),
+                    list(Forum.objects.order_by('id').values_list('post_count', 'topic_count', 'updated')))
+
+        self.assertEqual(Topic.objects.get(id=self.topic.id).post_count, 1)
+        self.assertEqual(Topic.objects.get(id=topic_2.id).post_count, 2)
+        self.assertEqual(Forum.objects.get(id=self.forum.id).post_count, 1)
+        self.assertEqual(Forum.objects.get(id=forum_2.id).post_count, 2)
+        self.assertEqual(Forum.objects.get(id=forum_2.id).updated, post.created)
+
+        post.delete()
+        incremental = counters()
+        for topic in Topic.objects.all():
+            topic.update_counters()
+        for forum in Forum.objects.all():
+            forum.update_counters()
+        self.assertEqual(incremental, counters())
+
+    def test_counters_with_stale_topic(self):
+        from pybb.forms import PostForm
+        topic_1, topic_2 = Topic.objects.get(id=self.topic.id), Topic.objects.get(id=self.topic.id)
+        for topic in (topic_1, topic_2):
+            form = PostForm(data={'body': 'reply'}, user=self.user, topic=topic, ip='127.0.0.1')
+            self.assertTrue(form.is_valid())
+            form.save()
+        self.assertEqual(Topic.objects.get(id=self.topic.id).post_count, 3)
+        # saving stale instance doesn't overwrite counters
+        topic_1.name = 'renamed'
+        topic_1.save()
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual((topic.name, topic.post_count, topic.last_post_id),
+                         ('renamed', 3, Post.objects.latest('id').id))
+
+        # forum topic counter is changed only when topic becomes empty in database
+        reply = Post.objects.filter(topic=self.topic).exclude(id=self.post.id).select_related('topic')[0]
+        reply.topic.post_count = 1
+        reply.delete()
+        self.assertEqual(Topic.objects.get(id=self.topic.id).post_count, 2)
+        self.assertEqual(Forum.objects.get(id=self.forum.id).topic_count, 1)
+
+    def test_update_counters_command(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+
+        forum_2 = Forum.objects.create(name='new forum', category=self.category)
+        topic_2 = Topic.objects.create(name='new topic', forum=forum_2, user=self.user)
+        Post.objects.create(topic=topic_2, user=self.user, body='one')
+        post = Post.objects.create(topic=topic_2, user=self.user, body='two')
+        Topic.objects.create(name='empty topic', forum=forum_2, user=self.user)
+        expected = (list(Topic.objects.order_by('id').values_list('post_count', 'updated')),
+                    list(Forum.objects.order_by('id').values_list('post_count', 'topic_count', 'updated')))
+
+        Topic.objects.update(post_count=100)
+        Forum.objects.update(post_count=100, topic_count=100, updated=None)
+        call_command('pybb_update_counters', category=self.category.id, stdout=StringIO())
+        self.assertEqual(expected, (list(Topic.objects.order_by('id').values_list('post_count', 'updated')),
+                                    list(Forum.objects.order_by('id').values_list('post_count', 'topic_count',
+                                                                                  'updated'))))
+        self.assertEqual(Forum.objects.get(id=forum_2.id).updated, post.created)
+        self.assertEqual(Forum.objects.get(id=forum_2.id).topic_count, 1)
+
+    def test_first_last_post_references(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual(topic.first_post, self.post)
+        self.assertEqual(topic.last_post, self.post)
+        post_2 = Post.objects.create(topic=self.topic, user=self.user, body='two')
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual((topic.first_post, topic.last_post), (self.post, post_2))
+        self.assertEqual(Forum.objects.get(id=self.forum.id).last_post, post_2)
+
+        post_2.delete()
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual((topic.first_post, topic.last_post), (self.post, self.post))
+        self.assertEqual(Forum.objects.get(id=self.forum.id).last_post, self.post)
+
+        Topic.objects.update(first_post=None, last_post=None)
+        Forum.objects.update(last_post=None)
+        call_command('pybb_update_counters', forum=self.forum.id, stdout=StringIO())
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual((topic.first_post, topic.last_post), (self.post, self.post))
+        self.assertEqual(Forum.objects.get(id=self.forum.id).last_post, self.post)
+
+    def test_post_positions(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+
+        def positions():
+            return list(self.topic.posts.order_by('created', 'id').values_list('position', flat=True))
+
+        posts = [Post.objects.create(topic=self.topic, user=self.user, body='post %d' % i)
+                 for i in range(defaults.PYBB_TOPIC_PAGE_SIZE)]
+        self.assertEqual(positions(), list(range(1, defaults.PYBB_TOPIC_PAGE_SIZE + 2)))
+
+        # post created earlier is moved into the middle of the topic
+        topic_2 = Topic.objects.create(name='new topic', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_2, user=self.user, body='head')
+        moved = Post.objects.create(topic=topic_2, user=self.user, body='moved')
+        Post.objects.filter(id=moved.id).update(created=posts[0].created + (posts[1].created - posts[0].created) / 2)
+        moved = Post.objects.get(id=moved.id)
+        moved.topic = self.topic
+        moved.save()
+        self.assertEqual(Post.objects.get(id=moved.id).position, 3)
+        posts[0].delete()
+        self.assertEqual(positions(), list(range(1, defaults.PYBB_TOPIC_PAGE_SIZE + 2)))
+        self.assertEqual(Post.objects.get(id=moved.id).position, 2)
+
+        # posts deleted from one loaded list are shifted by their stored positions
+        loaded = list(self.topic.posts.order_by('created', 'id'))
+        loaded[1].delete()
+        loaded[2].delete()
+        self.assertEqual(positions(), list(range(1, defaults.PYBB_TOPIC_PAGE_SIZE)))
+        posts = [Post.objects.create(topic=self.topic, user=self.user, body='post %d' % i) for i in range(2)]
+        self.assertEqual(positions(), list(range(1, defaults.PYBB_TOPIC_PAGE_SIZE + 2)))
+
+        last = posts[-1]
+        response = self.client.get(last.get_absolute_url())
+        self.assertRedirects(response, '%s?page=2#post-%d' % (self.topic.get_absolute_url(), last.id))
+        response = self.client.get(self.topic.get_absolute_url(), data={'page': 2})
+        self.assertEqual(list(response.context['object_list']), [last])
+        self.assertIsInstance(response.context['paginator'], PositionPaginator)
+
+        # broken positions are not used and are restored by pybb_update_counters
+        self.topic.posts.update(position=0)
+        self.assertFalse(Topic.objects.get(id=self.topic.id).has_post_positions)
+        response = self.client.get(last.get_absolute_url())
+        self.assertRedirects(response, '%s?page=2#post-%d' % (self.topic.get_absolute_url(), last.id))
+        call_command('pybb_update_counters', forum=self.forum.id, stdout=StringIO())
+        self.assertEqual(positions(), list(range(1, defaults.PYBB_TOPIC_PAGE_SIZE + 2)))
+        self.assertTrue(Topic.objects.get(id=self.topic.id).has_post_positions)
+
+    def test_keyset_pagination(self):
+        defaults.PYBB_KEYSET_PAGINATION = True
+        try:
+            posts = [self.post] + [Post.objects.create(topic=self.topic, user=self.user, body='post %d' % i)
+                                   for i in range(defaults.PYBB_TOPIC_PAGE_SIZE * 2)]
+            url = self.topic.get_absolute_url()
+            response = self.client.get(url)
+            self.assertEqual(list(response.context['object_list']), posts[:defaults.PYBB_TOPIC_PAGE_SIZE])
+            page = response.context['page_obj']
+            self.assertFalse(page.has_previous())
+            response = self.client.get(url, data={'after': page.next_cursor()})
+            self.assertEqual(list(response.context['object_list']),
+                             posts[defaults.PYBB_TOPIC_PAGE_SIZE:defaults.PYBB_TOPIC_PAGE_SIZE * 2])
+
+            # numbered pages are resolved through anchors table
+            response = self.client.get(url, data={'page': 3})
+            self.assertEqual(list(response.context['object_list']), posts[defaults.PYBB_TOPIC_PAGE_SIZE * 2:])
+            page = response.context['page_obj']
+            self.assertEqual(page.number, 3)
+            self.assertFalse(page.has_next())
+            response = self.client.get(url, data={'before': page.previous_cursor()})
+            self.assertEqual(list(response.context['object_list']),
+                             posts[defaults.PYBB_TOPIC_PAGE_SIZE:defaults.PYBB_TOPIC_PAGE_SIZE * 2])
+            self.assertEqual(response.context['page_obj'].number, 2)
+            self.assertContains(response, '?after=%s' % response.context['page_obj'].next_cursor())
+
+            self.assertEqual(self.client.get(url, data={'page': 4}).status_code, 404)
+            self.assertEqual(self.client.get(url, data={'after': 'garbage'}).status_code, 404)
+
+            response = self.client.get(self.forum.get_absolute_url())
+            self.assertEqual(list(response.context['topic_list']), [self.topic])
+            response = self.client.get(reverse('pybb:topic_latest'))
+            self.assertEqual(list(response.context['topic_list']), [self.topic])
+        finally:
+            defaults.PYBB_KEYSET_PAGINATION = False
+
+    def test_forum_hides_empty_topics(self):
+        # topics without posts are not counted in forum counter and are not listed
+        empty = Topic.objects.create(name='empty', forum=self.forum, user=self.user)
+        response = self.client.get(self.forum.get_absolute_url())
+        self.assertEqual(list(response.context['topic_list']), [self.topic])
+        self.assertEqual(response.context['paginator'].count, 1)
+        Post.objects.create(topic=empty, user=self.user, body='one')
+        response = self.client.get(self.forum.get_absolute_url())
+        self.assertEqual(list(response.context['topic_list']), [Topic.objects.get(id=empty.id), self.topic])
+
+    def test_topic_count_migration(self):
+        from django.apps import apps
+        migration = import_module('pybb.migrations.0010_recount_forum_topic_count')
+        Topic.objects.create(name='empty', forum=self.forum, user=self.user)
+        # counter of previous versions included topics without posts
+        Forum.objects.filter(id=self.forum.id).update(topic_count=2)
+        forum_2 = Forum.objects.create(name='f2', category=self.category, topic_count=1)
+        ForumCounterShard.objects.create(forum=self.forum, slot=0, topic_count=1)
+        migration.recount_topic_count(apps, None)
+        self.assertEqual(Forum.objects.get(id=self.forum.id).topic_count, 1)
+        self.assertEqual(Forum.objects.get(id=forum_2.id).topic_count, 0)
+        self.assertEqual(ForumCounterShard.objects.get(forum=self.forum).topic_count, 0)
+
+    def test_paginator_count_from_counters(self):
+        Topic.objects.filter(id=self.topic.id).update(post_count=5)
+        Forum.objects.filter(id=self.forum.id).update(topic_count=7)
+        response = self.client.get(self.topic.get_absolute_url())
+        self.assertEqual(response.context['paginator'].count, 5)
+        # topics on moderation are hidden from other users also without premoderation, so they are counted
+        response = self.client.get(self.forum.get_absolute_url())
+        self.assertEqual(response.context['paginator'].count, 1)
+        self.user.is_superuser = True
+        self.user.save()
+        self.login_client()
+        response = self.client.get(self.forum.get_absolute_url())
+        self.assertEqual(response.context['paginator'].count, 7)
+        self.client.logout()
+
+        # user may not see posts and topics on moderation, so they are counted
+        defaults.PYBB_PREMODERATION = True
+        try:
+            response = self.client.get(self.topic.get_absolute_url())
+            self.assertEqual(response.context['paginator'].count, 1)
+            response = self.client.get(self.forum.get_absolute_url())
+            self.assertEqual(response.context['paginator'].count, 1)
+        finally:
+            defaults.PYBB_PREMODERATION = False
+
+    def test_forum_counter_shards(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+
+        defaults.PYBB_FORUM_COUNTER_SHARDS = 4
+        try:
+            topic = Topic.objects.create(name='new topic', forum=self.forum, user=self.user)
+            Post.objects.create(topic=topic, user=self.user, body='one')
+            post = Post.objects.create(topic=topic, user=self.user, body='two')
+            forum = Forum.objects.get(id=self.forum.id)
+            self.assertEqual((forum.post_count, forum.topic_count), (1, 1))
+            self.assertNotEqual(forum.last_post, post)
+
+            response = self.client.get(self.forum.get_absolute_url())
+            self.assertEqual((response.context['forum'].post_count, response.context['forum'].topic_count), (3, 2))
+            self.assertEqual(response.context['forum'].last_post, post)
+            response = self.client.get(reverse('pybb:index'))
+            forum = response.context['categories'][0].forums_accessed[0]
+            self.assertEqual((forum.post_count, forum.topic_count, forum.last_post), (3, 2, post))
+
+            post.delete()
+            call_command('pybb_fold_counter_shards', stdout=StringIO())
+            forum = Forum.objects.get(id=self.forum.id)
+            self.assertEqual((forum.post_count, forum.topic_count), (2, 2))
+            self.assertEqual(forum.last_post, topic.last_post)
+            self.assertFalse(ForumCounterShard.objects.exclude(post_count=0, topic_count=0).exists())
+
+            # deleting a post which is not the latest one doesn't touch forum activity and shards
+            defaults.PYBB_FORUM_COUNTER_SHARDS = 1
+            Post.objects.create(topic=topic, user=self.user, body='three')
+            latest = Post.objects.create(topic=self.topic, user=self.user, body='four')
+            post = Post.objects.get(body='three')
+            with self.assertNumQueries(24):
+                post.delete()
+            self.assertEqual(ForumCounterShard.objects.apply([Forum.objects.get(id=self.forum.id)])[0].last_post,
+                             latest)
+        finally:
+            defaults.PYBB_FORUM_COUNTER_SHARDS = 0
+
+    def test_compact_read_tracking(self):
+        defaults.PYBB_READ_TRACKING_BACKEND = 'pybb.read_tracking.CompactReadTracking'
+        try:
+            topic_2 = Topic.objects.create(name='topic_2', forum=self.forum, user=self.user)
+            Post.objects.create(topic=topic_2, user=self.user, body='one')
+            topics = list(Topic.objects.filter(forum=self.forum).order_by('id'))
+            self.login_client()
+            self.assertTrue(pybb_is_topic_unread(self.topic, self.user))
+
+            self.client.get(self.topic.get_absolute_url())
+            self.assertFalse(pybb_is_topic_unread(self.topic, self.user))
+            self.assertEqual([t.unread for t in pybb_topic_unread(topics, self.user)], [False, True])
+            self.assertTrue(pybb_forum_unread([self.forum], self.user)[0].unread)
+            self.assertEqual(ForumReadState.objects.get(user=self.user, forum=self.forum).time_stamp, None)
+
+            # reading the last unread topic marks the whole forum and drops topic marks
+            self.client.get(topic_2.get_absolute_url())
+            state = ForumReadState.objects.get(user=self.user, forum=self.forum)
+            self.assertNotEqual(state.time_stamp, None)
+            self.assertEqual(state.topics, '')
+            self.assertFalse(pybb_forum_unread([Forum.objects.get(id=self.forum.id)], self.user)[0].unread)
+            self.assertEqual([t.unread for t in pybb_topic_unread(topics, self.user)], [False, False])
+            self.assertFalse(TopicReadTracker.objects.exists())
+            self.assertFalse(ForumReadTracker.objects.exists())
+
+            post = Post.objects.create(topic=topic_2, user=self.user, body='two')
+            topic_2 = Topic.objects.get(id=topic_2.id)
+            self.assertTrue(pybb_is_topic_unread(topic_2, self.user))
+            response = self.client.get(topic_2.get_absolute_url(), data={'first-unread': 1}, follow=True)
+            self.assertRedirects(response, '%s?page=%d#post-%d' % (topic_2.get_absolute_url(), 1, post.id))
+
+            # marks are written with upsert of state row, without insert attempt and savepoint
+            Post.objects.create(topic=self.topic, user=self.user, body='two')
+            topic = Topic.objects.select_related('forum').get(id=self.topic.id)
+            with self.assertNumQueries(4):
+                get_read_tracking().mark_topic_read(self.user, topic)
+            self.assertFalse(pybb_is_topic_unread(topic, self.user))
+        finally:
+            defaults.PYBB_READ_TRACKING_BACKEND = 'pybb.read_tracking.RowReadTracking'
+
+    def test_mark_read_skips_stale_topic_marks(self):
+        topic_2 = Topic.objects.create(name='topic_2', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_2, user=self.user, body='one')
+        topic_3 = Topic.objects.create(name='topic_3', forum=self.forum, user=self.user)
+        Post.objects.create(topic=topic_3, user=self.user, body='one')
+        for backend in ('pybb.read_tracking.RowReadTracking', 'pybb.read_tracking.CompactReadTracking'):
+            defaults.PYBB_READ_TRACKING_BACKEND = backend
+            try:
+                TopicReadTracker.objects.mark_read(self.user, Topic.objects.get(id=self.topic.id))
+                TopicReadTracker.objects.mark_read(self.user, Topic.objects.get(id=topic_2.id))
+                # topic mark becomes stale
+                Post.objects.create(topic=self.topic, user=self.user, body='two')
+                TopicReadTracker.objects.mark_read(self.user, Topic.objects.get(id=topic_3.id))
+                self.assertFalse(ForumReadTracker.objects.get_marks(self.user, [self.forum]))
+                TopicReadTracker.objects.mark_read(self.user, Topic.objects.get(id=self.topic.id))
+                self.assertIn(self.forum.id, ForumReadTracker.objects.get_marks(self.user, [self.forum]))
+                self.assertFalse(TopicReadTracker.objects.get_marks(self.user, Topic.objects.all()))
+            finally:
+                defaults.PYBB_READ_TRACKING_BACKEND = 'pybb.read_tracking.RowReadTracking'
+
     def test_user_views(self):
         response = self.client.get(reverse('pybb:user', kwargs={'username': self.user.username}))
         self.assertEqual(response.status_code, 200)
@@ -1086,6 +1939,39 @@ class FeaturesTest(TestCase, SharedTestModule):
         post.delete()
         self.assertEqual(Profile.objects.get(pk=util.get_pybb_profile(self.user).pk).post_count, 1)
 
+    def test_tracked_fields(self):
+        post = Post.objects.get(id=self.post.id)
+        self.assertFalse(post.field_changed('body'))
+        post.body_html = 'not rendered'
+        post.on_moderation = False
+        post.save()
+        self.assertEqual(Post.objects.get(id=post.id).body_html, 'not rendered')
+        post.body = 'changed'
+        self.assertTrue(post.field_changed('body'))
+        post.save()
+        self.assertFalse(post.field_changed('body'))
+        self.assertEqual(Post.objects.get(id=post.id).body_text, 'changed')
+
+        forum_2 = Forum.objects.create(name='new forum', category=self.category)
+        topic = Topic.objects.only('id', 'name', 'slug', 'forum').get(id=self.topic.id)
+        self.assertFalse(topic.field_changed('forum_id'))
+        topic.forum = forum_2
+        self.assertTrue(topic.field_changed('forum_id'))
+        topic.save()
+        self.assertFalse(topic.field_changed('forum_id'))
+        self.assertEqual(Forum.objects.get(id=forum_2.id).post_count, 1)
+        self.assertEqual(Forum.objects.get(id=self.forum.id).post_count, 0)
+
+    def test_post_count_update_skips_profile_save(self):
+        profile = util.get_pybb_profile(self.user)
+        Profile.objects.filter(pk=profile.pk).update(signature='[b]sign[/b]', signature_html='stale')
+        post = Post.objects.create(topic=self.topic, user=self.user, body='test')
+        profile = Profile.objects.get(pk=profile.pk)
+        self.assertEqual(profile.post_count, 2)
+        self.assertEqual(profile.signature_html, 'stale')
+        post.delete()
+        self.assertEqual(Profile.objects.get(pk=profile.pk).post_count, 1)
+
     def test_latest_topics_tag(self):
         Topic.objects.all().delete()
         for i in range(10):
@@ -1828,6 +2714,13 @@ class CustomPermissionHandlerTest(TestCase, SharedTestModule):
             r = self.get_with_user(p.get_absolute_url(), 'zeus', 'zeus')
             self.assertEqual(r.status_code, 302)
 
+    def test_counters_with_custom_filters(self):
+        # posts and topics hidden by overridden filters are counted by counters
+        topic = Topic.objects.filter(forum=self.forum)[0]
+        self.assertFalse(permissions.perms.may_view_all_posts(self.user, topic))
+        self.assertFalse(permissions.perms.may_view_all_topics(self.user, self.forum))
+        self.assertTrue(permissions.DefaultPermissionHandler().may_view_all_posts(self.user, topic))
+
     def test_poll_add(self):
         add_topic_url = reverse('pybb:add_topic', kwargs={'forum_id': self.forum.id})
         self.login_client()
@@ -12,7 +12,7 @@ from pybb.views import IndexView, CategoryView, ForumView, TopicView,\
     AddPostView, EditPostView, UserView, PostView, ProfileEditView,\
     DeletePostView, StickTopicView, UnstickTopicView, CloseTopicView,\
     OpenTopicView, ModeratePost, TopicPollVoteView, LatestTopicsView,\
-    UserTopics, UserPosts, topic_cancel_poll_vote
+    UnreadTopicsView, UnreadTopicsJsonView, UserTopics, UserPosts, topic_cancel_poll_vote
 
 
 urlpatterns = patterns('',
@@ -46,6 +46,8 @@ urlpatterns += patterns('pybb.views',
                         url('^topic/(?P<pk>\d+)/poll_vote/$', TopicPollVoteView.as_view(), name='topic_poll_vote'),
                         url('^topic/(?P<pk>\d+)/cancel_poll_vote/$', topic_cancel_poll_vote, name='topic_cancel_poll_vote'),
                         url('^topic/latest/$', LatestTopicsView.as_view(), name='topic_latest'),
+                        url('^topic/unread/$', UnreadTopicsView.as_view(), name='topic_unread'),
+                        url('^topic/unread/json/$', UnreadTopicsJsonView.as_view(), name='topic_unread_json'),
 
                         # Add topic/post
                         url('^forum/(?P<forum_id>\d+)/topic/add/$', AddPostView.as_view(), name='add_topic'),
@@ -68,6 +70,7 @@ urlpatterns += patterns('pybb.views',
 
                         # API
                         url('^api/post_ajax_preview/$', 'post_ajax_preview', name='post_ajax_preview'),
+                        url('^api/forum_unread/$', 'forum_unread_json', name='forum_unread_json'),
 
                         # Commands
                         url('^mark_all_as_read/$', 'mark_all_as_read', name='mark_all_as_read')
@@ -157,6 +157,27 @@ def get_pybb_profile_model():
 def build_cache_key(key_name, **kwargs):
     if key_name == 'anonymous_topic_views':
         return 'pybbm_anonymous_topic_%s_views' % kwargs['topic_id']
+    elif key_name == 'page_anchors':
+        return 'pybbm_page_anchors_%s_%s' % (kwargs['query_hash'], kwargs['per_page'])
+    elif key_name == 'read_marks_version':
+        return 'pybbm_read_marks_version_%s' % kwargs['user_id']
+    elif key_name == 'read_marks_buffer':
+        return 'pybbm_read_marks_buffer_%s_%s' % (kwargs['user_id'], kwargs['generation'])
+    elif key_name == 'read_marks_buffer_generation':
+        return 'pybbm_read_marks_buffer_generation_%s' % kwargs['user_id']
+    elif key_name == 'read_marks_buffer_users':
+        return 'pybbm_read_marks_buffer_users'
+    elif key_name == 'anonymous_page':
+        return 'pybbm_anonymous_page_%s_%s' % (kwargs['path_hash'], kwargs['language'])
+    elif key_name == 'latest_ids':
+        return 'pybbm_latest_ids_%s' % kwargs['model']
+    elif key_name == 'feed':
+        return 'pybbm_feed_%s_%s_%s_%s' % (kwargs['name'], kwargs['group'], kwargs['language'], kwargs['version'])
+    elif key_name == 'generation':
+        return 'pybbm_generation_%s_%s' % (kwargs['model'], kwargs['pk'])
+    elif key_name == 'post_fragment':
+        return 'pybbm_post_fragment_%s_%s_%s_%s' % (kwargs['post_id'], kwargs['name'], kwargs['language'],
+                                                    kwargs['version'])
     else:
         raise ValueError('Wrong key_name parameter passed: %s' % key_name)
 
@@ -1,43 +1,107 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import hashlib
+import json
 import math
+import time
 
 from django.contrib.auth.decorators import login_required
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.urlresolvers import reverse
 from django.contrib import messages
-from django.db.models import F, Q
+from django.db.models import Count, F, Q
+from django.core.paginator import InvalidPage
 from django.forms.util import ErrorList
 from django.http import HttpResponseRedirect, HttpResponse, Http404, HttpResponseBadRequest,\
     HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils.translation import ugettext as _
+from django.utils.translation import ugettext as _, get_language
 from django.utils.decorators import method_decorator
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.views.generic.edit import ModelFormMixin
 from django.views.decorators.csrf import csrf_protect
 from django.views import generic
-from pybb import compat, defaults, util
+from pybb import compat, defaults, util, invalidation
 from pybb.compat import get_atomic_func
 from pybb.forms import PostForm, AdminPostForm, AttachmentFormSet, PollAnswerFormSet, PollForm
-from pybb.models import Category, Forum, Topic, Post, TopicReadTracker, ForumReadTracker, PollAnswerUser
+from pybb.models import Category, Forum, Topic, Post, TopicReadTracker, ForumReadTracker, PollAnswerUser, \
+    ForumCounterShard, lock_topics, renumber_posts
+from pybb.pagination import Paginator, PositionPaginator, KeysetPaginator, UnreadTopicsPaginator, \
+    pure_pagination
 from pybb.permissions import perms
-from pybb.templatetags.pybb_tags import pybb_topic_poll_not_voted
+from pybb.read_tracking import attach_unread_resolver, get_marks_version
+from pybb.signals import topic_moderated, post_moderated
+from pybb.templatetags.pybb_tags import pybb_topic_poll_not_voted, pybb_forum_unread
 
 
 User = compat.get_user_model()
 username_field = compat.get_username_field()
-Paginator, pure_pagination = compat.get_paginator_class()
+
+# relations used by topic lists, denormalized last post included
+TOPIC_LIST_RELATED = ('forum', 'forum__category', 'user', 'last_post', 'last_post__user')
+
+
+def get_post_page(user, topic, post):
+    """
+    Number of the topic page with `post`
+    """
+    if perms.may_view_all_posts(user, topic) and topic.has_post_positions:
+        count = post.position
+    else:
+        count = topic.posts.filter(created__lt=post.created).count() + 1
+    return int(math.ceil(count / float(defaults.PYBB_TOPIC_PAGE_SIZE)))
 
 
 class PaginatorMixin(object):
+    # sort key used by keyset pagination, see PYBB_KEYSET_PAGINATION setting
+    keyset_ordering = None
+
     def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
         kwargs = {}
         if pure_pagination:
             kwargs['request'] = self.request
-        return Paginator(queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs)
+        paginator = self.get_paginator_class()(queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs)
+        count = self.get_count_hint()
+        if count is not None:
+            compat.set_paginator_count(paginator, count)
+        return paginator
+
+    def get_paginator_class(self):
+        return Paginator
+
+    def get_count_hint(self):
+        """ number of paginated objects if it's known without COUNT query, None otherwise """
+        return None
+
+    def get_keyset_cache_version(self):
+        """ value which changes when objects are added to or removed from paginated list """
+        return ''
+
+    def use_keyset_pagination(self):
+        return bool(defaults.PYBB_KEYSET_PAGINATION and self.keyset_ordering)
+
+    def get_keyset_paginator(self, queryset, page_size):
+        return KeysetPaginator(queryset, page_size, self.keyset_ordering,
+                               cache_version=self.get_keyset_cache_version(),
+                               cache_timeout=defaults.PYBB_PAGE_ANCHORS_CACHE_TIMEOUT)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination():
+            return super(PaginatorMixin, self).paginate_queryset(queryset, page_size)
+        paginator = self.get_keyset_paginator(queryset, page_size)
+        try:
+            if self.request.GET.get('after'):
+                page = paginator.page_after(self.request.GET['after'])
+            elif self.request.GET.get('before'):
+                page = paginator.page_before(self.request.GET['before'])
+            else:
+                page = paginator.page(self.kwargs.get('page') or self.request.GET.get('page') or 1)
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
 
 
 class RedirectToLoginMixin(object):
@@ -60,7 +124,97 @@ class RedirectToLoginMixin(object):
         return '/'
 
 
-class IndexView(generic.ListView):
+def conditional_get(request, view_func, objects, last_modified, *args, **kwargs):
+    """
+    Call `view_func` unless client has the page with `objects` changed at `last_modified`,
+    answer 304 Not Modified otherwise. Only ETag is sent: page also changes on edits, moderation,
+    votes and moves which don't change `last_modified`, so it is used as part of ETag only.
+    """
+    if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)) or \
+            not invalidation.is_enabled():
+        # generations are not maintained without caches
+        return view_func(request, *args, **kwargs)
+    etag = invalidation.get_etag(request.user, objects, last_modified and last_modified.isoformat())
+    return condition(etag_func=lambda request, *args, **kwargs: etag)(view_func)(request, *args, **kwargs)
+
+
+class ConditionalGetMixin(object):
+    """
+    Answers 304 Not Modified before page queries are made, see `conditional_get`
+    """
+
+    def get_cache_objects(self):
+        """ objects shown on the page, page changes with their generations """
+        return []
+
+    def get_last_modified(self):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        response = conditional_get(request, super(ConditionalGetMixin, self).dispatch, self.get_cache_objects(),
+                                   self.get_last_modified(), *args, **kwargs)
+        if response.status_code == 304:
+            self.not_modified()
+        return response
+
+    def not_modified(self):
+        pass
+
+
+class AnonymousPageCacheMixin(object):
+    """
+    Serves pages to anonymous users from cache, see PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT setting.
+    Cached page is valid until it expires or generation of any object returned by
+    `get_cache_objects` is changed. Only one request renders expired page, others get the
+    stale copy meanwhile.
+    """
+    # max time in seconds a request may hold the right to render the page
+    page_cache_lock_timeout = 30
+
+    def get_cache_objects(self):
+        return []
+
+    def dispatch(self, request, *args, **kwargs):
+        if not defaults.PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT or request.method != 'GET' or \
+                request.user.is_authenticated() or len(messages.get_messages(request)):
+            return super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        cache_key = util.build_cache_key(
+            'anonymous_page', path_hash=hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest(),
+            language=get_language())
+        version = invalidation.get_version(*self.get_cache_objects())
+        cached = cache.get(cache_key)
+        if cached is not None and cached['version'] == version and cached['expires'] > time.time():
+            return self.get_cached_response(cached)
+
+        lock_key = '%s_lock' % cache_key
+        if not cache.add(lock_key, True, self.page_cache_lock_timeout):
+            # page is being rendered by another request
+            if cached is not None:
+                return self.get_cached_response(cached)
+            return super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        try:
+            response = super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            # pages with csrf token or cookies are personal
+            if response.status_code == 200 and not response.cookies and not request.META.get('CSRF_COOKIE_USED'):
+                # stale copy is kept longer to be served while page is rendered again
+                cache.set(cache_key, {'version': version,
+                                      'expires': time.time() + defaults.PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT,
+                                      'content': response.content,
+                                      'content_type': response['Content-Type']},
+                          defaults.PYBB_ANONYMOUS_PAGE_CACHE_TIMEOUT * 2)
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    def get_cached_response(self, cached):
+        return HttpResponse(cached['content'], content_type=cached['content_type'])
+
+
+class IndexView(AnonymousPageCacheMixin, generic.ListView):
 
     template_name = 'pybb/index.html'
     context_object_name = 'categories'
@@ -69,15 +223,20 @@ class IndexView(generic.ListView):
         ctx = super(IndexView, self).get_context_data(**kwargs)
         categories = ctx['categories']
         for category in categories:
-            category.forums_accessed = perms.filter_forums(self.request.user, category.forums.filter(parent=None))
+            category.forums_accessed = ForumCounterShard.objects.apply(perms.filter_forums(
+                self.request.user, category.forums.filter(parent=None).select_related('last_post', 'last_post__user')))
+            attach_unread_resolver(self.request.user, forums=category.forums_accessed)
         ctx['categories'] = categories
         return ctx
 
     def get_queryset(self):
         return perms.filter_categories(self.request.user, Category.objects.all())
 
+    def get_cache_objects(self):
+        return list(Category.objects.all())
+
 
-class CategoryView(RedirectToLoginMixin, generic.DetailView):
+class CategoryView(ConditionalGetMixin, AnonymousPageCacheMixin, RedirectToLoginMixin, generic.DetailView):
 
     template_name = 'pybb/index.html'
     context_object_name = 'category'
@@ -96,9 +255,20 @@ class CategoryView(RedirectToLoginMixin, generic.DetailView):
             raise PermissionDenied
         return obj
 
+    def get_cache_objects(self):
+        if not hasattr(self, '_category'):
+            self._category = super(CategoryView, self).get_object()
+        return [self._category]
+
+    def get_last_modified(self):
+        return invalidation.get_last_update(self.get_cache_objects()[0].forums.all())
+
     def get_context_data(self, **kwargs):
         ctx = super(CategoryView, self).get_context_data(**kwargs)
-        ctx['category'].forums_accessed = perms.filter_forums(self.request.user, ctx['category'].forums.filter(parent=None))
+        ctx['category'].forums_accessed = ForumCounterShard.objects.apply(perms.filter_forums(
+            self.request.user,
+            ctx['category'].forums.filter(parent=None).select_related('last_post', 'last_post__user')))
+        attach_unread_resolver(self.request.user, forums=ctx['category'].forums_accessed)
         ctx['categories'] = [ctx['category']]
         return ctx
 
@@ -108,30 +278,42 @@ class CategoryView(RedirectToLoginMixin, generic.DetailView):
         return super(CategoryView, self).get(*args, **kwargs)
 
 
-class ForumView(RedirectToLoginMixin, PaginatorMixin, generic.ListView):
+class ForumView(ConditionalGetMixin, AnonymousPageCacheMixin, RedirectToLoginMixin, PaginatorMixin,
+                generic.ListView):
 
     paginate_by = defaults.PYBB_FORUM_PAGE_SIZE
     context_object_name = 'topic_list'
     template_name = 'pybb/forum.html'
+    keyset_ordering = ('-sticky', '-updated', '-id')
 
     def dispatch(self, request, *args, **kwargs):
-        self.forum = self.get_forum(**kwargs)
+        self.forum = ForumCounterShard.objects.apply([self.get_forum(**kwargs)])[0]
         return super(ForumView, self).dispatch(request, *args, **kwargs)
 
     def get_login_redirect_url(self):
         return self.forum.get_absolute_url()
 
+    def get_cache_objects(self):
+        return [self.forum]
+
+    def get_last_modified(self):
+        return self.forum.updated
+
     def get_context_data(self, **kwargs):
         ctx = super(ForumView, self).get_context_data(**kwargs)
         ctx['forum'] = self.forum
-        ctx['forum'].forums_accessed = perms.filter_forums(self.request.user, self.forum.child_forums.all())
+        ctx['forum'].forums_accessed = ForumCounterShard.objects.apply(perms.filter_forums(
+            self.request.user, self.forum.child_forums.select_related('last_post', 'last_post__user')))
+        attach_unread_resolver(self.request.user, topics=ctx['topic_list'], forums=ctx['forum'].forums_accessed)
         return ctx
 
     def get_queryset(self):
         if not perms.may_view_forum(self.request.user, self.forum):
             raise PermissionDenied
 
-        qs = self.forum.topics.order_by('-sticky', '-updated', '-id').select_related()
+        # topics without posts are not counted in forum counter and are not shown
+        qs = self.forum.topics.filter(post_count__gt=0).order_by('-sticky', '-updated', '-id')\
+            .select_related(*TOPIC_LIST_RELATED)
         qs = perms.filter_topics(self.request.user, qs)
         return qs
 
@@ -144,23 +326,100 @@ class ForumView(RedirectToLoginMixin, PaginatorMixin, generic.ListView):
             raise Http404(_('Forum does not exist'))
         return forum
 
+    def get_keyset_cache_version(self):
+        return '%s:%s' % (self.forum.topic_count, self.forum.updated)
+
+    def get_count_hint(self):
+        if perms.may_view_all_topics(self.request.user, self.forum):
+            return self.forum.topic_count
+
     def get(self, *args, **kwargs):
         if defaults.PYBB_NICE_URL and 'pk' in kwargs:
             return redirect(self.forum, permanent=defaults.PYBB_NICE_URL_PERMANENT_REDIRECT)
         return super(ForumView, self).get(*args, **kwargs)
 
 
-class LatestTopicsView(PaginatorMixin, generic.ListView):
+class LatestTopicsView(ConditionalGetMixin, PaginatorMixin, generic.ListView):
 
     paginate_by = defaults.PYBB_FORUM_PAGE_SIZE
     context_object_name = 'topic_list'
     template_name = 'pybb/latest_topics.html'
+    keyset_ordering = ('-updated', '-id')
 
     def get_queryset(self):
-        qs = Topic.objects.all().select_related()
+        qs = Topic.objects.all().select_related(*TOPIC_LIST_RELATED)
         qs = perms.filter_topics(self.request.user, qs)
         return qs.order_by('-updated', '-id')
 
+    def get_cache_objects(self):
+        return list(Category.objects.all())
+
+    def get_last_modified(self):
+        return invalidation.get_last_update(Forum.objects.all())
+
+    def get_context_data(self, **kwargs):
+        ctx = super(LatestTopicsView, self).get_context_data(**kwargs)
+        attach_unread_resolver(self.request.user, topics=ctx['topic_list'])
+        return ctx
+
+
+class UnreadTopicsView(PaginatorMixin, generic.ListView):
+    """
+    Topics from all forums unread by the user, latest updates first, always paginated with cursors
+    """
+    paginate_by = defaults.PYBB_FORUM_PAGE_SIZE
+    context_object_name = 'topic_list'
+    template_name = 'pybb/unread_topics.html'
+    keyset_ordering = ('-updated', '-id')
+
+    @method_decorator(login_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(UnreadTopicsView, self).dispatch(request, *args, **kwargs)
+
+    def use_keyset_pagination(self):
+        return True
+
+    def get_queryset(self):
+        # unread topics are selected by paginator
+        return perms.filter_topics(self.request.user, Topic.objects.all().select_related(*TOPIC_LIST_RELATED))
+
+    def get_keyset_paginator(self, queryset, page_size):
+        forums = perms.filter_forums(self.request.user, Forum.objects.all()).values_list('id', flat=True)
+        return UnreadTopicsPaginator(queryset, page_size, self.request.user, forums,
+                                     cache_version=self.get_keyset_cache_version(),
+                                     cache_timeout=defaults.PYBB_PAGE_ANCHORS_CACHE_TIMEOUT)
+
+    def get_keyset_cache_version(self):
+        return '%s:%s' % (self.request.user.pk, get_marks_version(self.request.user.pk))
+
+    def get_context_data(self, **kwargs):
+        ctx = super(UnreadTopicsView, self).get_context_data(**kwargs)
+        attach_unread_resolver(self.request.user, topics=ctx['topic_list'])
+        return ctx
+
+
+class UnreadTopicsJsonView(UnreadTopicsView):
+    """
+    JSON version of `UnreadTopicsView`, page cursors are returned in "next" and "previous" keys
+    """
+
+    def render_to_response(self, context, **response_kwargs):
+        page = context['page_obj']
+        data = {
+            'topics': [{
+                'id': topic.id,
+                'name': topic.name,
+                'url': topic.get_absolute_url(),
+                'first_unread_url': '%s?first-unread=1' % topic.get_absolute_url(),
+                'forum': {'id': topic.forum_id, 'name': topic.forum.name},
+                'post_count': topic.post_count,
+                'updated': topic.updated.isoformat() if topic.updated else None,
+            } for topic in context['topic_list']],
+            'next': page.next_cursor() if page else None,
+            'previous': page.previous_cursor() if page else None,
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
 
 class PybbFormsMixin(object):
 
@@ -186,45 +445,30 @@ class PybbFormsMixin(object):
         return self.poll_answer_formset_class
 
 
-class TopicView(RedirectToLoginMixin, PaginatorMixin, PybbFormsMixin, generic.ListView):
+class TopicView(ConditionalGetMixin, AnonymousPageCacheMixin, RedirectToLoginMixin, PaginatorMixin, PybbFormsMixin,
+                generic.ListView):
     paginate_by = defaults.PYBB_TOPIC_PAGE_SIZE
     template_object_name = 'post_list'
     template_name = 'pybb/topic.html'
+    keyset_ordering = ('created', 'id')
 
     def get_login_redirect_url(self):
         return self.topic.get_absolute_url()
 
-    @method_decorator(csrf_protect)
-    def dispatch(self, request, *args, **kwargs):
-        self.topic = self.get_topic(**kwargs)
+    def get_cache_objects(self):
+        return [self.topic]
 
-        if request.GET.get('first-unread'):
-            if request.user.is_authenticated():
-                read_dates = []
-                try:
-                    read_dates.append(TopicReadTracker.objects.get(user=request.user, topic=self.topic).time_stamp)
-                except TopicReadTracker.DoesNotExist:
-                    pass
-                try:
-                    read_dates.append(ForumReadTracker.objects.get(user=request.user, forum=self.topic.forum).time_stamp)
-                except ForumReadTracker.DoesNotExist:
-                    pass
-
-                read_date = read_dates and max(read_dates)
-                if read_date:
-                    try:
-                        first_unread_topic = self.topic.posts.filter(created__gt=read_date).order_by('created', 'id')[0]
-                    except IndexError:
-                        first_unread_topic = self.topic.last_post
-                else:
-                    first_unread_topic = self.topic.head
-                return HttpResponseRedirect(reverse('pybb:post', kwargs={'pk': first_unread_topic.id}))
+    def get_last_modified(self):
+        return self.topic.updated
 
-        return super(TopicView, self).dispatch(request, *args, **kwargs)
+    def get_cached_response(self, cached):
+        self.count_view()
+        return super(TopicView, self).get_cached_response(cached)
 
-    def get_queryset(self):
-        if not perms.may_view_topic(self.request.user, self.topic):
-            raise PermissionDenied
+    def not_modified(self):
+        self.count_view()
+
+    def count_view(self):
         if self.request.user.is_authenticated() or not defaults.PYBB_ANONYMOUS_VIEWS_CACHE_BUFFER:
             Topic.objects.filter(id=self.topic.id).update(views=F('views') + 1)
         else:
@@ -234,13 +478,48 @@ class TopicView(RedirectToLoginMixin, PaginatorMixin, PybbFormsMixin, generic.Li
                 Topic.objects.filter(id=self.topic.id).update(views=F('views') +
                                                                 defaults.PYBB_ANONYMOUS_VIEWS_CACHE_BUFFER)
                 cache.set(cache_key, 0)
+
+    @method_decorator(csrf_protect)
+    def dispatch(self, request, *args, **kwargs):
+        self.topic = self.get_topic(**kwargs)
+
+        if request.GET.get('first-unread'):
+            if request.user.is_authenticated():
+                posts = perms.filter_posts(request.user, self.topic.posts.all())
+                first_unread_post = TopicReadTracker.objects.get_first_unread_post(request.user, self.topic, posts)
+                if first_unread_post is None:
+                    first_unread_post = self.topic.last_post or self.topic.get_last_post()
+                page = get_post_page(request.user, self.topic, first_unread_post)
+                return HttpResponseRedirect('%s?page=%d#post-%d' % (self.topic.get_absolute_url(), page,
+                                                                     first_unread_post.id))
+
+        return super(TopicView, self).dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if not perms.may_view_topic(self.request.user, self.topic):
+            raise PermissionDenied
+        self.count_view()
         qs = self.topic.posts.all().select_related('user')
         if defaults.PYBB_PROFILE_RELATED_NAME:
             qs = qs.select_related('user__%s' % defaults.PYBB_PROFILE_RELATED_NAME)
+        self.view_all_posts = perms.may_view_all_posts(self.request.user, self.topic)
+        self.seek_by_position = self.view_all_posts and self.topic.has_post_positions
         if not perms.may_moderate_topic(self.request.user, self.topic):
             qs = perms.filter_posts(self.request.user, qs)
         return qs
 
+    def get_paginator_class(self):
+        if self.seek_by_position:
+            return PositionPaginator
+        return super(TopicView, self).get_paginator_class()
+
+    def get_keyset_cache_version(self):
+        return '%s:%s' % (self.topic.post_count, self.topic.updated)
+
+    def get_count_hint(self):
+        if self.view_all_posts:
+            return self.topic.post_count
+
     def get_context_data(self, **kwargs):
         ctx = super(TopicView, self).get_context_data(**kwargs)
 
@@ -254,6 +533,7 @@ class TopicView(RedirectToLoginMixin, PaginatorMixin, PybbFormsMixin, generic.Li
             else:
                 ctx['form'] = self.get_post_form_class()(topic=self.topic)
             self.mark_read(self.request.user, self.topic)
+            attach_unread_resolver(self.request.user, topics=[self.topic])
         elif defaults.PYBB_ENABLE_ANONYMOUS_POST:
             ctx['form'] = self.get_post_form_class()(topic=self.topic)
         else:
@@ -267,6 +547,8 @@ class TopicView(RedirectToLoginMixin, PaginatorMixin, PybbFormsMixin, generic.Li
         else:
             ctx['first_post'] = None
         ctx['topic'] = self.topic
+        if defaults.PYBB_POST_CACHE_TIMEOUT:
+            invalidation.attach_post_versions(list(ctx['post_list']) + [ctx['first_post']])
 
         if perms.may_vote_in_topic(self.request.user, self.topic) and \
                 pybb_topic_poll_not_voted(self.topic, self.request.user):
@@ -275,36 +557,14 @@ class TopicView(RedirectToLoginMixin, PaginatorMixin, PybbFormsMixin, generic.Li
         return ctx
 
     def mark_read(self, user, topic):
-        try:
-            forum_mark = ForumReadTracker.objects.get(forum=topic.forum, user=user)
-        except ForumReadTracker.DoesNotExist:
-            forum_mark = None
-        if (forum_mark is None) or (forum_mark.time_stamp < topic.updated):
-            # Mark topic as readed
-            topic_mark, new = TopicReadTracker.objects.get_or_create_tracker(topic=topic, user=user)
-            if not new:
-                topic_mark.save()
-
-            # Check, if there are any unread topics in forum
-            readed = topic.forum.topics.filter((Q(topicreadtracker__user=user,
-                                                  topicreadtracker__time_stamp__gte=F('updated'))) |
-                                                Q(forum__forumreadtracker__user=user,
-                                                  forum__forumreadtracker__time_stamp__gte=F('updated')))\
-                                       .only('id').order_by()
-
-            not_readed = topic.forum.topics.exclude(id__in=readed)
-            if not not_readed.exists():
-                # Clear all topic marks for this forum, mark forum as readed
-                TopicReadTracker.objects.filter(user=user, topic__forum=topic.forum).delete()
-                forum_mark, new = ForumReadTracker.objects.get_or_create_tracker(forum=topic.forum, user=user)
-                forum_mark.save()
+        TopicReadTracker.objects.mark_read(user, topic)
 
     def get_topic(self, **kwargs):
         if 'pk' in kwargs:
-            topic = get_object_or_404(Topic, pk=kwargs['pk'], post_count__gt=0)
+            topic = get_object_or_404(Topic.objects.select_related('last_post'), pk=kwargs['pk'], post_count__gt=0)
         elif ('slug'and 'forum_slug'and 'category_slug') in kwargs:
             topic = get_object_or_404(
-                Topic,
+                Topic.objects.select_related('last_post'),
                 slug=kwargs['slug'],
                 forum__slug=kwargs['forum_slug'],
                 forum__category__slug=kwargs['category_slug'],
@@ -514,6 +774,7 @@ class UserPosts(PaginatorMixin, generic.ListView):
     model = Post
     paginate_by = defaults.PYBB_TOPIC_PAGE_SIZE
     template_name = 'pybb/user_posts.html'
+    keyset_ordering = ('-created', '-id')
 
     def dispatch(self, request, *args, **kwargs):
         username = kwargs.pop('username')
@@ -545,7 +806,7 @@ class UserTopics(PaginatorMixin, generic.ListView):
 
     def get_queryset(self):
         qs = super(UserTopics, self).get_queryset()
-        qs = qs.filter(user=self.user)
+        qs = qs.filter(user=self.user).select_related(*TOPIC_LIST_RELATED)
         qs = perms.filter_topics(self.user, qs)
         qs = qs.order_by('-updated', '-created', '-id')
         return qs
@@ -553,6 +814,7 @@ class UserTopics(PaginatorMixin, generic.ListView):
     def get_context_data(self, **kwargs):
         context = super(UserTopics, self).get_context_data(**kwargs)
         context['target_user'] = self.user
+        attach_unread_resolver(self.request.user, topics=context['object_list'])
         return context
 
 
@@ -570,12 +832,11 @@ class PostView(RedirectToLoginMixin, generic.RedirectView):
     def get_redirect_url(self, **kwargs):
         if not perms.may_view_post(self.request.user, self.post):
             raise PermissionDenied
-        count = self.post.topic.posts.filter(created__lt=self.post.created).count() + 1
-        page = math.ceil(count / float(defaults.PYBB_TOPIC_PAGE_SIZE))
+        page = get_post_page(self.request.user, self.post.topic, self.post)
         return '%s?page=%d#post-%d' % (self.post.topic.get_absolute_url(), page, self.post.id)
 
     def get_post(self, **kwargs):
-        return get_object_or_404(Post, pk=kwargs['pk'])
+        return get_object_or_404(Post.objects.select_related('topic', 'topic__last_post'), pk=kwargs['pk'])
 
 
 class ModeratePost(generic.RedirectView):
@@ -583,11 +844,19 @@ class ModeratePost(generic.RedirectView):
     permanent = False
 
     def get_redirect_url(self, **kwargs):
-        post = get_object_or_404(Post, pk=self.kwargs['pk'])
+        post = get_object_or_404(Post.objects.select_related('topic'), pk=self.kwargs['pk'])
         if not perms.may_moderate_topic(self.request.user, post.topic):
             raise PermissionDenied
-        post.on_moderation = False
-        post.save()
+        if post.on_moderation:
+            Post.objects.filter(pk=post.pk).update(on_moderation=False)
+            post.on_moderation = False
+            post_moderated.send(sender=Post, post=post, user=self.request.user, changes={'on_moderation': False})
+            # If post is topic head, moderate topic too
+            if post.topic.on_moderation and post.topic.head == post:
+                Topic.objects.filter(pk=post.topic_id).update(on_moderation=False)
+                post.topic.on_moderation = False
+                topic_moderated.send(sender=Topic, topic=post.topic, user=self.request.user,
+                                     changes={'on_moderation': False})
         return post.get_absolute_url()
 
 
@@ -661,14 +930,22 @@ class TopicActionBaseView(generic.View):
         self.action(self.topic)
         return HttpResponseRedirect(self.topic.get_absolute_url())
 
+    def update_topic(self, topic, **changes):
+        """
+        Apply moderator's changes with single UPDATE query instead of full topic save
+        """
+        Topic.objects.filter(pk=topic.pk).update(**changes)
+        for name, value in changes.items():
+            setattr(topic, name, value)
+        topic_moderated.send(sender=Topic, topic=topic, user=self.request.user, changes=changes)
+
 
 class StickTopicView(TopicActionBaseView):
 
     def action(self, topic):
         if not perms.may_stick_topic(self.request.user, topic):
             raise PermissionDenied
-        topic.sticky = True
-        topic.save()
+        self.update_topic(topic, sticky=True)
 
 
 class UnstickTopicView(TopicActionBaseView):
@@ -676,8 +953,7 @@ class UnstickTopicView(TopicActionBaseView):
     def action(self, topic):
         if not perms.may_unstick_topic(self.request.user, topic):
             raise PermissionDenied
-        topic.sticky = False
-        topic.save()
+        self.update_topic(topic, sticky=False)
 
 
 class CloseTopicView(TopicActionBaseView):
@@ -685,16 +961,14 @@ class CloseTopicView(TopicActionBaseView):
     def action(self, topic):
         if not perms.may_close_topic(self.request.user, topic):
             raise PermissionDenied
-        topic.closed = True
-        topic.save()
+        self.update_topic(topic, closed=True)
 
 
 class OpenTopicView(TopicActionBaseView):
     def action(self, topic):
         if not perms.may_open_topic(self.request.user, topic):
             raise PermissionDenied
-        topic.closed = False
-        topic.save()
+        self.update_topic(topic, closed=False)
 
 
 class TopicPollVoteView(PybbFormsMixin, generic.UpdateView):
@@ -765,12 +1039,51 @@ def post_ajax_preview(request):
     return render(request, 'pybb/_markitup_preview.html', {'html': html})
 
 
+def _get_requested_forum_ids(request):
+    try:
+        return [int(forum_id) for forum_id in request.GET.get('forums', '').split(',') if forum_id]
+    except ValueError:
+        return None
+
+
+def forum_unread_etag(request):
+    if not request.user.is_authenticated():
+        return None
+    forum_dict, children = attach_unread_resolver(request.user).get_forum_tree()
+    tree = sorted((forum.id, forum.updated and forum.updated.isoformat(), forum.topic_count)
+                  for forum in forum_dict.values())
+    key = '%s:%s:%s:%s' % (request.user.pk, get_marks_version(request.user.pk),
+                           _get_requested_forum_ids(request), tree)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+@login_required
+@cache_control(private=True)
+@condition(etag_func=forum_unread_etag)
+def forum_unread_json(request):
+    """
+    Unread flags (subforums included) and numbers of unread topics of forums given by comma separated
+    ids in `forums` GET parameter, for the current user
+    """
+    forum_ids = _get_requested_forum_ids(request)
+    if forum_ids is None:
+        return HttpResponseBadRequest()
+    forums = list(perms.filter_forums(request.user, Forum.objects.filter(id__in=forum_ids)))
+    resolver = attach_unread_resolver(request.user)
+    forum_dict, children = resolver.get_forum_tree()
+    # forum tree has counters with shards applied
+    forums = pybb_forum_unread([forum_dict.get(forum.id, forum) for forum in forums], request.user)
+    topics = perms.filter_topics(request.user, Topic.objects.all())
+    counts = dict(TopicReadTracker.objects.filter_unread(request.user, topics, forums).order_by()
+                  .values_list('forum').annotate(Count('id')))
+    data = {'forums': dict((forum.id, {'unread': forum.unread, 'unread_topics': counts.get(forum.id, 0)})
+                           for forum in forums)}
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
 @login_required
 def mark_all_as_read(request):
-    for forum in perms.filter_forums(request.user, Forum.objects.all()):
-        forum_mark, new = ForumReadTracker.objects.get_or_create_tracker(forum=forum, user=request.user)
-        forum_mark.save()
-    TopicReadTracker.objects.filter(user=request.user).delete()
+    ForumReadTracker.objects.mark_read(request.user, perms.filter_forums(request.user, Forum.objects.all()))
     msg = _('All forums marked as read')
     messages.success(request, msg, fail_silently=True)
     return redirect(reverse('pybb:index'))
@@ -785,24 +1098,22 @@ def block_user(request, username):
     user.is_active = False
     user.save()
     if 'block_and_delete_messages' in request.POST:
-        # individually delete each post and empty topic to fire method
-        # with forum/topic counters recalculation
+        # posts and topics are deleted in bulk without Post.delete, so positions
+        # and counters of affected topics and forums are recounted after deletion
         posts = Post.objects.filter(user=user)
-        topics = posts.values('topic_id').distinct()
-        forums = posts.values('topic__forum_id').distinct()
-        posts.delete()
-        Topic.objects.filter(user=user).delete()
-        for t in topics:
-            try:
-                Topic.objects.get(id=t['topic_id']).update_counters()
-            except Topic.DoesNotExist:
-                pass
-        for f in forums:
-            try:
-                Forum.objects.get(id=f['topic__forum_id']).update_counters()
-            except Forum.DoesNotExist:
-                pass
-
+        topic_ids = set(posts.order_by().values_list('topic_id', flat=True).distinct())
+        forum_ids = set(Topic.objects.filter(Q(id__in=topic_ids) | Q(user=user))
+                        .order_by().values_list('forum_id', flat=True).distinct())
+        with get_atomic_func()():
+            lock_topics(*topic_ids)
+            posts.delete()
+            Topic.objects.filter(user=user).delete()
+            topics = list(Topic.objects.filter(id__in=topic_ids))
+            renumber_posts([topic.id for topic in topics])
+            for topic in topics:
+                topic.update_counters()
+            for forum in Forum.objects.filter(id__in=forum_ids):
+                forum.update_counters()
 
     msg = _('User successfuly blocked')
     messages.success(request, msg, fail_silently=True)